@@ -0,0 +1,121 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# --- Answer cache for repeated questions ---
+# Level one: exact-match LRU on the normalised prompt plus mode, model, temperature and
+# a fingerprint of the preceding conversation. Level two (optional): a semantic cache
+# that reuses an answer when a new first-turn question embeds close to a cached one.
+# Both levels are dropped whenever the knowledge base changes.
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+HIT_EXACT = "exact"
+HIT_SEMANTIC = "semantic"
+MISS = "miss"
+
+_PUNCTUATION_EDGES = re.compile(r"^[\s\W_]+|[\s\W_]+$")
+
+
+def normalize_prompt(prompt):
+    # Case, spacing and trailing "?"/"。" differences should not cause a miss
+    collapsed = " ".join(prompt.lower().split())
+    return _PUNCTUATION_EDGES.sub("", collapsed)
+
+
+def conversation_fingerprint(summary, history):
+    # Empty for a fresh conversation, so first-turn questions are shared across sessions
+    if not summary and not history:
+        return ""
+    digest = hashlib.sha1((summary or "").encode("utf-8"))
+    for message in history:
+        digest.update(f"\0{message['role']}\0{message['content']}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, semantic=True,
+                 similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> answer, least recently used first
+        self._vectors = {} # key -> unit query vector, first-turn entries only
+        self.hits = {HIT_EXACT: 0, HIT_SEMANTIC: 0}
+        self.misses = 0
+
+    @staticmethod
+    def _key(prompt, scope, context):
+        return (normalize_prompt(prompt), tuple(scope), context)
+
+    def lookup(self, prompt, scope, context="", embed_fn=None):
+        """Return (answer, HIT_EXACT | HIT_SEMANTIC) or (None, MISS).
+
+        `scope` is (mode, model, temperature); `embed_fn(text)` is only called
+        when the exact lookup misses and the semantic level applies.
+        """
+        key = self._key(prompt, scope, context)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits[HIT_EXACT] += 1
+                return self._entries[key], HIT_EXACT
+
+        if self.semantic and embed_fn is not None and not context:
+            match = self._nearest(self._unit(embed_fn(prompt)), key[1])
+            if match is not None:
+                with self._lock:
+                    if match in self._entries:
+                        self._entries.move_to_end(match)
+                        self.hits[HIT_SEMANTIC] += 1
+                        return self._entries[match], HIT_SEMANTIC
+
+        with self._lock:
+            self.misses += 1
+        return None, MISS
+
+    def store(self, prompt, scope, answer, context="", embed_fn=None):
+        key = self._key(prompt, scope, context)
+        vector = None
+        if self.semantic and embed_fn is not None and not context:
+            vector = self._unit(embed_fn(prompt))
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            if vector is not None:
+                self._vectors[key] = vector
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._vectors.pop(evicted, None)
+
+    def invalidate(self):
+        # Cached answers may quote knowledge base content that has changed
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _nearest(self, vector, scope):
+        with self._lock:
+            candidates = [(key, v) for key, v in self._vectors.items() if key[1] == scope and v.shape == vector.shape]
+        if not candidates:
+            return None
+        similarities = np.stack([v for _, v in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return candidates[best][0]
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,20 +1,74 @@
 import streamlit as st
-import ollama
-from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
-import tempfile
-import shutil # For removing directory
+import copy
+import secrets
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from chat_engine import stream_chat_turn, summarize_conversation as summarize_chat
+from memory import ConversationMemory
+from conversation_store import ConversationStore
+from model_registry import ModelRegistry
+from chunking import ChunkingProfile
+from ingestion import IngestionSettings, ingest_files
+from ingestion_jobs import (IngestionJobQueue, STATUS_CANCELLED as JOB_CANCELLED, STATUS_DONE as JOB_DONE,
+                            STATUS_FAILED as JOB_FAILED, STATUS_QUEUED as JOB_QUEUED, STATUS_RUNNING as JOB_RUNNING)
+from manifest import IngestionManifest
+from keyword_index import KeywordIndex
+from retrieval import RETRIEVAL_HYBRID, RETRIEVAL_KEYWORD
+from embedding_cache import CachedEmbeddings, EmbeddingCacheStore
+from metrics import MetricsRecorder
+from rendering import StreamRenderer
+from scheduler import (PRIORITY_BACKGROUND, PRIORITY_BULK, RequestScheduler, ScheduledClient, ScheduledEmbeddings,
+                       SchedulerBusyError)
+from answer_cache import AnswerCache, HIT_EXACT, HIT_SEMANTIC, MISS, conversation_fingerprint
+from model_lifecycle import (ModelLifecycleManager, KIND_EMBEDDING, STATUS_FAILED, STATUS_LOADING,
+                             STATUS_READY)
+
+# How long the cached Ollama model list is trusted before asking the daemon again
+MODEL_LIST_TTL_SECONDS = 60
+EMBEDDING_MODEL = "nomic-embed-text"
+# Every chat, summary and embedding request asks Ollama to keep its model loaded this long
+MODEL_KEEP_ALIVE_SECONDS = 30 * 60
+# Data files (knowledge base, caches, logs, conversations) are kept next to app.py
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# --- Helper Functions to Check Ollama Service ---
+@st.cache_resource
+def get_model_registry():
+    # Shared by all sessions, so reruns read a snapshot instead of calling ollama.list()
+    return ModelRegistry(ttl_seconds=MODEL_LIST_TTL_SECONDS)
 
-# --- Helper Function to Check Ollama Service ---
 def is_ollama_running():
-    try:
-        ollama.list()
-        return True
-    except Exception:
-        return False
+    return get_model_registry().snapshot().running
+
+# Per-turn and ingestion timings, appended as JSON lines and rotated at 5 MB
+METRICS_LOG_PATH = os.path.join(current_dir, "logs", "metrics.jsonl")
+# Request scheduling: concurrent requests Ollama gets per model, and how many may wait before new ones are refused
+SCHEDULER_CHAT_CONCURRENCY = 1
+SCHEDULER_EMBEDDING_CONCURRENCY = 2
+SCHEDULER_MAX_QUEUE = 32
+
+@st.cache_resource
+def get_metrics_recorder():
+    # Shared by all sessions so the diagnostics panel shows process-wide percentiles
+    return MetricsRecorder(METRICS_LOG_PATH)
+
+@st.cache_resource
+def get_request_scheduler():
+    # Every session and the ingestion worker take turns through this one scheduler
+    return RequestScheduler(
+        default_limit=SCHEDULER_CHAT_CONCURRENCY,
+        limits={EMBEDDING_MODEL: SCHEDULER_EMBEDDING_CONCURRENCY},
+        max_queue=SCHEDULER_MAX_QUEUE,
+        recorder=get_metrics_recorder()
+    )
+
+@st.cache_resource
+def get_model_lifecycle():
+    # Shared by all sessions, so a model is only warmed once per process
+    return ModelLifecycleManager(keep_alive=MODEL_KEEP_ALIVE_SECONDS, scheduler=get_request_scheduler())
 
 # --- Language Management ---
 # Define all text strings for translation
@@ -32,6 +86,18 @@ translations = {
         "temperature_slider_label": "Generation Temperature (Temperature)",
         "temperature_slider_help": "Higher values will make the output more random, while lower values will make the output more focused and deterministic.",
         "clear_chat_history_button": "Clear Chat History",
+        "conversations_title": "Conversations",
+        "select_conversation": "Open a saved conversation",
+        "new_conversation": "New conversation",
+        "new_conversation_button": "New Conversation",
+        "conversation_save_failed": "This message could not be saved to the conversation history: {e}",
+        "resume_code_title": "Resume Code",
+        "resume_code_caption": "Your saved conversations are tied to this code. After a refresh or in another tab, enter it below to get them back. Anyone with the code can read them, so keep it to yourself.",
+        "resume_code_input": "Enter a resume code",
+        "resume_code_button": "Resume",
+        "resume_code_unknown": "No saved conversations were found for that code.",
+        "show_earlier_messages_button": "Show {count} earlier messages",
+        "show_earlier_messages_help": "{count} earlier messages are hidden to keep the page fast.",
         "assistant_mode_title": "Assistant Mode",
         "general_assistant_mode": "General Assistant",
         "general_assistant_instruction": "You are a helpful assistant. Please answer questions based on the provided context information (if any) and conversation history.",
@@ -49,6 +115,7 @@ translations = {
         "knowledge_base_init_failed": "Knowledge base initialization failed: {e}. Please ensure Ollama is running and the 'nomic-embed-text' model is downloaded.",
         "embedding_model_not_downloaded_warning": "❗ Embedding model `nomic-embed-text` is not yet downloaded. Please run `ollama pull nomic-embed-text` in the command line.",
         "unsupported_file_type_warning": "Unsupported file type: {file_extension}. Skipping {file_name}",
+        "duplicate_file_name_warning": "More than one uploaded file is named {file_name}. Only the first was added; rename the others and upload them again.",
         "no_text_extracted_warning": "File {file_name} detected no text content or content is empty. Please ensure it is a selectable text PDF or a text file with content.",
         "file_loading_failed_error": "Failed to load file {file_name}: {e}",
         "loading_files_progress": "Loading files...",
@@ -59,6 +126,7 @@ translations = {
         "no_docs_processed_info": "No documents processed.",
         "upload_docs_label": "Upload Your Knowledge Documents (TXT, MD, PDF)",
         "upload_docs_help": "Please upload documents containing selectable text. Scanned PDFs may not be able to extract text.",
+        "chunking_profile_caption": "Documents processed now are split for the {mode} mode into passages of up to {chunk_tokens} tokens; each question retrieves up to {top_k} passages.",
         "process_uploaded_files_button": "Process Uploaded Files",
         "clear_knowledge_base_button": "Clear Knowledge Base",
         "clear_knowledge_base_success": "Knowledge base cleared.",
@@ -93,7 +161,57 @@ translations = {
         "language_switch_en": "English",
         "language_switch_zh": "中文",
         "select_assistant_mode": "Select Assistant Mode",
-        "select_language": "Select Language / 选择语言"
+        "select_language": "Select Language / 选择语言",
+        "rag_context_prompt": "Use the following excerpts from the local knowledge base when they are relevant to the question. If they do not contain the answer, say so and answer from general knowledge.\n\n{context}",
+        "retrieval_failed_warning": "Knowledge base search failed, answering without it: {e}",
+        "conversation_summary_prompt": "Summary of the earlier part of this conversation:\n{summary}",
+        "file_already_ingested_info": "Skipped {file_name}: the same content is already in the knowledge base as {stored_as}.",
+        "docs_updated_info": "Reused {num_unchanged} unchanged document blocks and removed {num_removed} outdated ones.",
+        "answer_cache_hit_exact": "⚡ Answered from cache (the same question was asked before)",
+        "answer_cache_hit_semantic": "⚡ Answered from cache (a very similar question was asked before)",
+        "answer_cache_miss": "Newly generated answer",
+        "diagnostics_title": "Diagnostics",
+        "diagnostics_metric": "Metric",
+        "diagnostics_samples": "Samples",
+        "diagnostics_ttft": "Time to first token (ms)",
+        "diagnostics_model_load": "Model load (ms)",
+        "diagnostics_prefill": "Prompt processing (ms)",
+        "diagnostics_decode_speed": "Generation speed (tokens/s)",
+        "diagnostics_total_turn": "Total answer time (ms)",
+        "diagnostics_retrieval": "Knowledge base search (ms)",
+        "diagnostics_queue_wait": "Wait for a model slot (ms)",
+        "diagnostics_embed_batch": "Embedding batch (ms)",
+        "diagnostics_parse_file": "File parsing (ms)",
+        "diagnostics_ingestion_speed": "Ingestion speed (blocks/s)",
+        "diagnostics_empty": "No measurements yet. Ask a question or process documents to collect timings.",
+        "diagnostics_log_location": "Recent events only. The full log is written to `{path}`.",
+        "diagnostics_scheduler_title": "Model slots right now",
+        "diagnostics_scheduler_model": "Model",
+        "diagnostics_scheduler_active": "In use",
+        "diagnostics_scheduler_limit": "Limit",
+        "diagnostics_scheduler_waiting": "Waiting",
+        "ingestion_progress": "Processing documents: {files_done}/{files_total} files, {num_splits} blocks embedded...",
+        "refresh_models_button": "Refresh Model List",
+        "refresh_models_help": "Re-read the installed models from Ollama, for example after running `ollama pull`.",
+        "scheduler_waiting": "⏳ The model is busy with other users' questions. Your question is number {position} in line...",
+        "scheduler_busy_warning": "The assistant is handling too many questions right now. Please try again in a moment.",
+        "keyword_search_toggle": "Fast keyword search",
+        "keyword_search_help": "Search the knowledge base by exact words only. Answers start sooner because the embedding model is not used, but questions phrased differently from the documents may find less.",
+        "ingestion_job_label": "**Upload {job_id}** ({num_files} files)",
+        "ingestion_job_queued": "⏳ Waiting, position {position} in the queue. You can keep chatting meanwhile.",
+        "ingestion_job_cancelling": "Stopping after the current batch...",
+        "ingestion_job_cancelled": "⏹️ Cancelled. Files finished so far are kept; resume to continue where it stopped.",
+        "ingestion_job_cancel_button": "Cancel",
+        "ingestion_job_resume_button": "Resume",
+        "ingestion_job_dismiss_button": "Dismiss",
+        "clear_knowledge_base_busy_warning": "Documents are still being processed. Wait for them to finish or cancel them first.",
+        "model_status_chat": "Chat model `{model}`: {status}",
+        "model_status_embedding": "Embedding model `{model}`: {status}",
+        "model_status_ready": "🟢 loaded",
+        "model_status_loading": "🟡 loading...",
+        "model_status_cold": "⚪ not loaded",
+        "model_status_failed": "🔴 failed to load ({e})",
+        "memory_summary_request": "Update the running summary of a conversation between a user and an assistant. Keep facts, decisions, names, numbers and open questions; drop small talk. Reply with the updated summary only, in at most {max_words} words.\n\nCurrent summary:\n{summary}\n\nNew messages:\n{transcript}"
     },
     "zh": {
         "page_title": "本地智慧助手",
@@ -108,6 +226,18 @@ translations = {
         "temperature_slider_label": "生成温度 (Temperature)",
         "temperature_slider_help": "较高的值会使输出更随机，较低的值会使输出更集中和确定。",
         "clear_chat_history_button": "清空聊天记录",
+        "conversations_title": "对话记录",
+        "select_conversation": "打开已保存的对话",
+        "new_conversation": "新对话",
+        "new_conversation_button": "新建对话",
+        "conversation_save_failed": "此消息未能保存到对话记录：{e}",
+        "resume_code_title": "恢复码",
+        "resume_code_caption": "您保存的对话与此恢复码绑定。刷新页面或在其他标签页中，在下方输入它即可找回对话。任何拿到恢复码的人都能查看这些对话，请勿泄露。",
+        "resume_code_input": "输入恢复码",
+        "resume_code_button": "恢复",
+        "resume_code_unknown": "未找到与该恢复码对应的已保存对话。",
+        "show_earlier_messages_button": "显示更早的 {count} 条消息",
+        "show_earlier_messages_help": "为保持页面流畅，已隐藏 {count} 条更早的消息。",
         "assistant_mode_title": "助手模式",
         "general_assistant_mode": "通用助手",
         "general_assistant_instruction": "你是一个乐于助人的助手。请根据提供的上下文信息（如果提供）和对话历史来回答问题。",
@@ -125,6 +255,7 @@ translations = {
         "knowledge_base_init_failed": "知识库初始化失败: {e}. 请确保 Ollama 正在运行且 'nomic-embed-text' 模型已下载。",
         "embedding_model_not_downloaded_warning": "❗ 嵌入模型 `nomic-embed-text` 尚未下载。请在命令行中运行 `ollama pull nomic-embed-text`。",
         "unsupported_file_type_warning": "不支持的文件类型: {file_extension}。跳过 {file_name}",
+        "duplicate_file_name_warning": "有多个上传文件名为 {file_name}。只添加了第一个；请重命名其余文件后重新上传。",
         "no_text_extracted_warning": "文件 {file_name} 未检测到任何文本内容或内容为空白。请确保是可选择文本的PDF或有内容的文本文件。",
         "file_loading_failed_error": "加载文件 {file_name} 失败: {e}",
         "loading_files_progress": "正在加载文件...",
@@ -135,6 +266,7 @@ translations = {
         "no_docs_processed_info": "未处理任何文档。",
         "upload_docs_label": "上传您的知识文档 (TXT, MD, PDF)",
         "upload_docs_help": "请上传包含可选择文本的文档。扫描版PDF可能无法提取文本。",
+        "chunking_profile_caption": "现在处理的文档将按{mode}模式切分为最多 {chunk_tokens} 个词元的段落；每个问题最多检索 {top_k} 个段落。",
         "process_uploaded_files_button": "处理上传文件",
         "clear_knowledge_base_button": "清除知识库",
         "clear_knowledge_base_success": "知识库已清空。",
@@ -169,7 +301,57 @@ translations = {
         "language_switch_en": "English",
         "language_switch_zh": "中文",
         "select_assistant_mode": "Select Assistant Mode",
-        "select_language": "Select Language / 选择语言"
+        "select_language": "Select Language / 选择语言",
+        "rag_context_prompt": "当以下本地知识库摘录与问题相关时，请参考它们作答。如果其中没有答案，请说明并根据常识回答。\n\n{context}",
+        "retrieval_failed_warning": "知识库检索失败，将在不使用知识库的情况下回答: {e}",
+        "conversation_summary_prompt": "此前对话的摘要：\n{summary}",
+        "file_already_ingested_info": "已跳过 {file_name}：相同内容已作为 {stored_as} 存在于知识库中。",
+        "docs_updated_info": "复用了 {num_unchanged} 个未变化的文档块，删除了 {num_removed} 个过时的文档块。",
+        "answer_cache_hit_exact": "⚡ 来自缓存的回答（之前问过相同的问题）",
+        "answer_cache_hit_semantic": "⚡ 来自缓存的回答（之前问过非常相似的问题）",
+        "answer_cache_miss": "新生成的回答",
+        "diagnostics_title": "诊断信息",
+        "diagnostics_metric": "指标",
+        "diagnostics_samples": "样本数",
+        "diagnostics_ttft": "首个词元延迟 (毫秒)",
+        "diagnostics_model_load": "模型加载 (毫秒)",
+        "diagnostics_prefill": "提示词处理 (毫秒)",
+        "diagnostics_decode_speed": "生成速度 (词元/秒)",
+        "diagnostics_total_turn": "回答总耗时 (毫秒)",
+        "diagnostics_retrieval": "知识库检索 (毫秒)",
+        "diagnostics_queue_wait": "等待模型空闲 (毫秒)",
+        "diagnostics_embed_batch": "嵌入批次 (毫秒)",
+        "diagnostics_parse_file": "文件解析 (毫秒)",
+        "diagnostics_ingestion_speed": "入库速度 (文档块/秒)",
+        "diagnostics_empty": "暂无测量数据。提问或处理文档后即可收集耗时。",
+        "diagnostics_log_location": "仅显示最近的事件，完整日志写入 `{path}`。",
+        "diagnostics_scheduler_title": "当前模型占用",
+        "diagnostics_scheduler_model": "模型",
+        "diagnostics_scheduler_active": "使用中",
+        "diagnostics_scheduler_limit": "上限",
+        "diagnostics_scheduler_waiting": "等待中",
+        "ingestion_progress": "正在处理文档: {files_done}/{files_total} 个文件，已嵌入 {num_splits} 个文档块...",
+        "refresh_models_button": "刷新模型列表",
+        "refresh_models_help": "重新从 Ollama 读取已安装的模型，例如在运行 `ollama pull` 之后。",
+        "scheduler_waiting": "⏳ 模型正在回答其他用户的问题。您的问题排在第 {position} 位...",
+        "scheduler_busy_warning": "助手当前需要处理的问题过多，请稍后再试。",
+        "keyword_search_toggle": "快速关键词检索",
+        "keyword_search_help": "仅按精确词语检索知识库。由于不调用嵌入模型，回答开始得更快，但与文档措辞不同的问题可能检索到的内容更少。",
+        "ingestion_job_label": "**上传任务 {job_id}**（{num_files} 个文件）",
+        "ingestion_job_queued": "⏳ 等待中，排在队列第 {position} 位。您可以继续聊天。",
+        "ingestion_job_cancelling": "将在当前批次完成后停止...",
+        "ingestion_job_cancelled": "⏹️ 已取消。已完成的文件会保留，点击继续可从中断处接着处理。",
+        "ingestion_job_cancel_button": "取消",
+        "ingestion_job_resume_button": "继续",
+        "ingestion_job_dismiss_button": "关闭",
+        "clear_knowledge_base_busy_warning": "文档仍在处理中。请等待处理完成或先取消。",
+        "model_status_chat": "对话模型 `{model}`：{status}",
+        "model_status_embedding": "嵌入模型 `{model}`：{status}",
+        "model_status_ready": "🟢 已加载",
+        "model_status_loading": "🟡 加载中...",
+        "model_status_cold": "⚪ 未加载",
+        "model_status_failed": "🔴 加载失败（{e}）",
+        "memory_summary_request": "请更新用户与助手之间对话的累积摘要。保留事实、决定、名称、数字和未解决的问题，省略寒暄。只回复更新后的摘要，不超过 {max_words} 字。\n\n当前摘要：\n{summary}\n\n新消息：\n{transcript}"
     }
 }
 
@@ -217,42 +399,183 @@ if not is_ollama_running():
     st.stop() # Stop app execution if Ollama is not running
 
 # Model selection
+model_snapshot = get_model_registry().snapshot()
 available_models = ["gemma3n:latest"] # Default model
-try:
-    ollama_models = ollama.list()['models']
-    for model_info in ollama_models:
-        if model_info['model'] not in available_models:
-            available_models.append(model_info['model'])
-except Exception:
+if model_snapshot.running:
+    for model_name in model_snapshot.models:
+        if model_name not in available_models:
+            available_models.append(model_name)
+else:
     st.sidebar.warning(get_text("ollama_connection_warning"))
 
 selected_model = st.sidebar.selectbox(get_text("select_model"), available_models)
 
+# Re-read the model list on demand, e.g. right after `ollama pull`
+if st.sidebar.button(get_text("refresh_models_button"), help=get_text("refresh_models_help")):
+    get_model_registry().refresh()
+    st.rerun()
+
 # Validate if selected model is available
-if selected_model not in [m['model'] for m in ollama.list()['models']]:
+if not model_snapshot.has_model(selected_model):
     st.warning(get_text("model_not_downloaded_warning").format(selected_model=selected_model))
 
+# Load the chat and embedding models in the background, so the first question does not wait for them
+model_lifecycle = get_model_lifecycle()
+warm_models = [(selected_model, "model_status_chat")]
+if model_snapshot.has_model(selected_model):
+    model_lifecycle.ensure_warm(selected_model)
+if model_snapshot.has_model(EMBEDDING_MODEL):
+    model_lifecycle.ensure_warm(EMBEDDING_MODEL, KIND_EMBEDDING)
+    warm_models.append((EMBEDDING_MODEL, "model_status_embedding"))
+
+# run_every is fixed when the page runs, so the fragment stops its own polling with a full rerun
+model_status_polling = model_lifecycle.is_loading()
+
+@st.fragment(run_every="2s" if model_status_polling else None)
+def show_model_status():
+    # Re-runs on its own while a model is loading, without rerunning the whole page
+    if model_status_polling and not model_lifecycle.is_loading():
+        st.rerun()
+    for model_name, label_key in warm_models:
+        status, detail = model_lifecycle.status(model_name)
+        if status == STATUS_READY:
+            status_text = get_text("model_status_ready")
+        elif status == STATUS_LOADING:
+            status_text = get_text("model_status_loading")
+        elif status == STATUS_FAILED:
+            status_text = get_text("model_status_failed").format(e=detail)
+        else:
+            status_text = get_text("model_status_cold")
+        st.caption(get_text(label_key).format(model=model_name, status=status_text))
+
+with st.sidebar:
+    show_model_status()
+
 
 # Temperature slider for model response creativity
 temperature = st.sidebar.slider(get_text("temperature_slider_label"), 0.0, 1.0, 0.7, 0.05,
                                 help=get_text("temperature_slider_help"))
 
-# Clear chat history button
+# --- Conversation History ---
+# Conversations are saved message by message and reopened from the page URL (?chat=...).
+# Each session has a secret owner token, shown as a resume code and never put in the URL:
+# the saved conversation list, reopening and deleting only ever see conversations started
+# under the session's token, so a shared link opens nothing. Entering the code after a
+# refresh, a restart or in another tab brings the conversations back.
+CONVERSATION_DB_PATH = os.path.join(current_dir, "conversations", "conversations.sqlite3")
+CONVERSATION_LIST_LIMIT = 20
+# Only the newest messages are drawn on each rerun; older ones are paged in on request
+CHAT_RECENT_MESSAGES = 20
+CHAT_PAGE_MESSAGES = 20
+
+# Conversation memory settings: recent turns kept verbatim, older turns rolled into a summary
+MEMORY_WINDOW_TOKENS = 2048
+MEMORY_SUMMARY_TOKENS = 512
+MEMORY_MIN_RECENT_MESSAGES = 2
+
+@st.cache_resource
+def get_conversation_store():
+    # One SQLite connection per process, shared by all sessions
+    return ConversationStore(CONVERSATION_DB_PATH)
+
+
+@st.cache_resource
+def get_memory_compactor():
+    # Conversation summaries are written off the script thread, one at a time for the whole process
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-compaction")
+
+
+def open_conversation(conversation_id):
+    # Load a saved conversation (or start an empty one) into this session
+    store = get_conversation_store()
+    owner = st.session_state.conversation_owner
+    if not store.owns(conversation_id, owner):
+        conversation_id = uuid.uuid4().hex # Someone else's link: start a new conversation instead
+    memory = ConversationMemory(
+        window_tokens=MEMORY_WINDOW_TOKENS,
+        summary_tokens=MEMORY_SUMMARY_TOKENS,
+        min_recent_messages=MEMORY_MIN_RECENT_MESSAGES
+    )
+    memory.summary, memory.summarized_count = store.memory_state(conversation_id, owner)
+    st.session_state.conversation_id = conversation_id
+    st.session_state.messages = store.messages(conversation_id, owner)
+    st.session_state.memory = memory
+    st.session_state.shown_messages = CHAT_RECENT_MESSAGES
+    st.query_params["chat"] = conversation_id
+
+
+def save_message(message):
+    # Kept in the session for this run and appended to the saved conversation
+    st.session_state.messages.append(message)
+    try:
+        get_conversation_store().append(st.session_state.conversation_id, st.session_state.conversation_owner,
+                                        message)
+    except Exception as e:
+        st.warning(get_text("conversation_save_failed").format(e=e))
+
+
+if "conversation_owner" not in st.session_state:
+    st.session_state.conversation_owner = secrets.token_urlsafe(12)
+if "conversation_id" not in st.session_state:
+    # After a refresh the URL still names the conversation; it reopens once the resume code is entered
+    st.session_state.requested_conversation = st.query_params.get("chat")
+    open_conversation(st.query_params.get("chat") or uuid.uuid4().hex)
+
+st.sidebar.markdown(get_text("divider") + "\n**" + get_text("conversations_title") + "**")
+saved_conversations = get_conversation_store().conversations(st.session_state.conversation_owner,
+                                                             limit=CONVERSATION_LIST_LIMIT)
+conversation_titles = {conversation_id: title for conversation_id, title, _ in saved_conversations}
+if conversation_titles:
+    conversation_options = list(conversation_titles)
+    if st.session_state.conversation_id not in conversation_titles:
+        conversation_options.insert(0, st.session_state.conversation_id) # Not saved until its first message
+    selected_conversation = st.sidebar.selectbox(
+        get_text("select_conversation"),
+        conversation_options,
+        index=conversation_options.index(st.session_state.conversation_id),
+        format_func=lambda conversation_id: conversation_titles.get(conversation_id) or get_text("new_conversation")
+    )
+    if selected_conversation != st.session_state.conversation_id:
+        open_conversation(selected_conversation)
+        st.rerun()
+
+if st.sidebar.button(get_text("new_conversation_button")):
+    open_conversation(uuid.uuid4().hex)
+    st.rerun()
+
+with st.sidebar.expander(get_text("resume_code_title")):
+    st.caption(get_text("resume_code_caption"))
+    st.code(st.session_state.conversation_owner, language=None)
+    resume_code = st.text_input(get_text("resume_code_input"), type="password").strip()
+    if st.button(get_text("resume_code_button")) and resume_code:
+        resumed_conversations = [conversation_id for conversation_id, _, _ in
+                                 get_conversation_store().conversations(resume_code, limit=CONVERSATION_LIST_LIMIT)]
+        if resumed_conversations:
+            st.session_state.conversation_owner = resume_code
+            requested_conversation = st.session_state.requested_conversation
+            open_conversation(requested_conversation if requested_conversation in resumed_conversations
+                              else resumed_conversations[0])
+            st.rerun()
+        st.warning(get_text("resume_code_unknown"))
+
+# Clear chat history button: deletes the saved conversation and starts a new one
 if st.sidebar.button(get_text("clear_chat_history_button")):
-    st.session_state.messages = []
+    get_conversation_store().delete(st.session_state.conversation_id, st.session_state.conversation_owner)
+    open_conversation(uuid.uuid4().hex)
     st.rerun() # Rerun the app to clear displayed messages
 
 # --- Dynamic System Instruction Mode ---
 st.sidebar.markdown(get_text("divider") + "\n**" + get_text("assistant_mode_title") + "**")
+# Each mode has a system instruction and a RAG profile (see RAG_MODE_PROFILES)
 scenario_modes = {
-    get_text("general_assistant_mode"): get_text("general_assistant_instruction"),
-    get_text("agriculture_expert_mode"): get_text("agriculture_expert_instruction"),
-    get_text("basic_medical_consultation_mode"): get_text("basic_medical_consultation_instruction"),
-    get_text("weather_disaster_alert_mode"): get_text("weather_disaster_alert_instruction"),
-    get_text("basic_education_knowledge_mode"): get_text("basic_education_knowledge_instruction")
+    get_text("general_assistant_mode"): (get_text("general_assistant_instruction"), "general"),
+    get_text("agriculture_expert_mode"): (get_text("agriculture_expert_instruction"), "agriculture"),
+    get_text("basic_medical_consultation_mode"): (get_text("basic_medical_consultation_instruction"), "medical"),
+    get_text("weather_disaster_alert_mode"): (get_text("weather_disaster_alert_instruction"), "weather"),
+    get_text("basic_education_knowledge_mode"): (get_text("basic_education_knowledge_instruction"), "education")
 }
 selected_mode = st.sidebar.selectbox(get_text("select_assistant_mode"), list(scenario_modes.keys()))
-system_instruction = scenario_modes[selected_mode]
+system_instruction, rag_profile_name = scenario_modes[selected_mode]
 
 
 st.sidebar.markdown(get_text("divider") + "\n**" + get_text("knowledge_base_rag_title") + "**")
@@ -260,102 +583,263 @@ st.sidebar.markdown(get_text("divider") + "\n**" + get_text("knowledge_base_rag_
 # --- RAG Specific Configuration and Functions ---
 # Persistent directory for ChromaDB
 # This will create a 'chroma_db_rag' folder next to app.py
-current_dir = os.path.dirname(os.path.abspath(__file__))
 PERSIST_DIRECTORY = os.path.join(current_dir, "chroma_db_rag")
+# Content hashes of ingested files and chunks, kept next to the ChromaDB folder
+MANIFEST_PATH = os.path.join(current_dir, "chroma_db_rag_manifest.json")
+# Embedding cache lives outside PERSIST_DIRECTORY so it survives "Clear Knowledge Base"
+EMBEDDING_CACHE_DIRECTORY = os.path.join(current_dir, "embedding_cache")
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+# Uploads waiting for (or interrupted during) background processing, kept across restarts
+INGESTION_SPOOL_DIRECTORY = os.path.join(current_dir, "ingestion_jobs")
 
-if "vectorstore" not in st.session_state:
-    st.session_state.chroma_db_dir = PERSIST_DIRECTORY
-    if not os.path.exists(st.session_state.chroma_db_dir):
-        os.makedirs(st.session_state.chroma_db_dir)
-    
-    # Initialize Ollama Embeddings
-    try:
-        st.session_state.embeddings = OllamaEmbeddings(model="nomic-embed-text")
-        # Check if nomic-embed-text is actually pulled
-        if "nomic-embed-text:latest" not in [m['model'] for m in ollama.list()['models']]:
-            st.warning(get_text("embedding_model_not_downloaded_warning"))
-            st.session_state.embeddings = None # Disable RAG if embedder is not ready
-        else:
-            st.session_state.vectorstore = Chroma(
-                embedding_function=st.session_state.embeddings,
-                persist_directory=st.session_state.chroma_db_dir
+# Retrieval settings: the token budget retrieved chunks may use per turn
+RAG_CONTEXT_TOKEN_BUDGET = 1500
+# Per assistant mode: how documents uploaded in that mode are chunked, and how many chunks a
+# question retrieves. Short, precise chunks suit dosages and alert levels; longer ones suit
+# explanations. Chunk sizes are in tokens; top_k * chunk_tokens stays within the budget above.
+RAG_MODE_PROFILES = {
+    "general": {"chunking": ChunkingProfile(chunk_tokens=256), "top_k": 4},
+    "agriculture": {"chunking": ChunkingProfile(chunk_tokens=256), "top_k": 4},
+    "medical": {"chunking": ChunkingProfile(chunk_tokens=192), "top_k": 5},
+    "weather": {"chunking": ChunkingProfile(chunk_tokens=160), "top_k": 4},
+    "education": {"chunking": ChunkingProfile(chunk_tokens=384), "top_k": 3}
+}
+rag_profile = RAG_MODE_PROFILES[rag_profile_name]
+# Vector hits are fused with BM25 keyword hits, which catch exact names and codes the embeddings miss
+RAG_RETRIEVAL_MODE = RETRIEVAL_HYBRID
+# BM25 index of the same chunks, stored with the ChromaDB files and cleared with them
+KEYWORD_INDEX_PATH = os.path.join(PERSIST_DIRECTORY, "keyword_index.sqlite3")
+# Vector backend: "chroma", or "quantized" for large knowledge bases on CPU-only machines
+# (int8 codes searched through an IVF index and re-ranked with the exact vectors: about two
+# thirds of ChromaDB's disk, and as fast or faster with higher recall; see quantized_store.py).
+# After switching, clear the knowledge base and upload the documents again.
+VECTOR_BACKEND = "chroma"
+QUANTIZED_INDEX_DIRECTORY = os.path.join(PERSIST_DIRECTORY, "quantized")
+
+# Ingestion pipeline settings: parsing runs in worker processes (threads in the packaged exe,
+# where spawning extra processes is not supported), embedding requests run concurrently
+INGESTION_SETTINGS = IngestionSettings(
+    parse_workers=0 if getattr(sys, "frozen", False) else min(4, os.cpu_count() or 1),
+    embed_batch_size=32,
+    embed_concurrency=4,
+    upsert_batch_size=512
+)
+
+# Answer cache settings: exact repeats always hit; similar first-turn questions hit above the threshold
+ANSWER_CACHE_MAX_ENTRIES = 256
+ANSWER_CACHE_SEMANTIC = True
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+
+# Streaming display: re-render the answer at most every 50 ms or every 20 tokens
+STREAM_RENDER_INTERVAL_SECONDS = 0.05
+STREAM_RENDER_MAX_PENDING = 20
+
+# Identifies this browser session to the scheduler, which serves sessions in turn
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+
+@st.cache_resource
+def get_keyword_index():
+    # Shared by all sessions and the ingestion worker, which keeps it in step with Chroma
+    return KeywordIndex(KEYWORD_INDEX_PATH)
+
+
+@st.cache_resource
+def get_embedding_cache_store():
+    # Shared by all sessions so concurrent ingestions reuse each other's vectors
+    return EmbeddingCacheStore(EMBEDDING_CACHE_DIRECTORY, EMBEDDING_MODEL, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+
+
+@st.cache_resource
+def get_ingestion_manifest():
+    # One manifest per process, since every session writes to the same knowledge base
+    return IngestionManifest(MANIFEST_PATH)
+
+
+# --- Shared knowledge base objects ---
+# langchain_ollama, chromadb and langchain_chroma take seconds to import, so they are
+# imported inside these getters on first use, and the client and embedder are created
+# once per process instead of once per browser session.
+@st.cache_resource
+def get_ollama_embeddings():
+    from langchain_ollama import OllamaEmbeddings
+    return OllamaEmbeddings(model=EMBEDDING_MODEL, keep_alive=MODEL_KEEP_ALIVE_SECONDS)
+
+
+@st.cache_resource
+def get_chroma_client():
+    import chromadb
+    os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
+    return chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+
+
+@st.cache_resource
+def get_quantized_index():
+    from quantized_store import QuantizedIndex
+    return QuantizedIndex(QUANTIZED_INDEX_DIRECTORY)
+
+
+@st.cache_resource
+def get_knowledge_base_version():
+    # Bumped when the knowledge base is cleared, so every session reopens the new collection
+    return {"version": 0}
+
+
+def open_vectorstore(embeddings):
+    # A thin view on the shared client or index; the embedder decides whose turn a query embedding takes
+    if VECTOR_BACKEND == "quantized":
+        from quantized_store import QuantizedVectorStore
+        return QuantizedVectorStore(get_quantized_index(), embeddings)
+    from langchain_chroma import Chroma
+    return Chroma(client=get_chroma_client(), embedding_function=embeddings)
+
+
+def knowledge_base_exists():
+    # Checked without importing chromadb; a store from before the manifest existed still counts
+    if VECTOR_BACKEND == "quantized":
+        store_file = os.path.join(QUANTIZED_INDEX_DIRECTORY, "chunks.sqlite3")
+    else:
+        store_file = os.path.join(PERSIST_DIRECTORY, "chroma.sqlite3")
+    return len(get_ingestion_manifest()) > 0 or os.path.exists(store_file)
+
+
+if "embeddings" not in st.session_state:
+    st.session_state.embeddings = None
+    st.session_state.vectorstore = None
+    # Check if nomic-embed-text is actually pulled
+    if not model_snapshot.has_model(EMBEDDING_MODEL):
+        st.warning(get_text("embedding_model_not_downloaded_warning")) # RAG stays disabled
+    else:
+        try:
+            st.session_state.embeddings = CachedEmbeddings(
+                ScheduledEmbeddings(
+                    get_ollama_embeddings(),
+                    get_request_scheduler(),
+                    EMBEDDING_MODEL,
+                    st.session_state.session_id
+                ),
+                get_embedding_cache_store()
             )
             st.sidebar.success(get_text("knowledge_base_loaded_success"))
+        except Exception as e:
+            st.sidebar.error(get_text("knowledge_base_init_failed").format(e=e))
+
+# The vector store is only opened once there is something in it
+knowledge_base_version = get_knowledge_base_version()["version"]
+if st.session_state.embeddings is not None and knowledge_base_exists() and (
+        st.session_state.vectorstore is None
+        or st.session_state.get("knowledge_base_version") != knowledge_base_version):
+    try:
+        st.session_state.vectorstore = open_vectorstore(st.session_state.embeddings)
+        st.session_state.knowledge_base_version = knowledge_base_version
+        # Knowledge bases built before the keyword index existed are indexed once here
+        get_keyword_index().sync_from(st.session_state.vectorstore)
     except Exception as e:
         st.sidebar.error(get_text("knowledge_base_init_failed").format(e=e))
-        st.session_state.embeddings = None
         st.session_state.vectorstore = None
 
+# Keyword-only search answers straight from the BM25 index, without waiting for the embedding model
+if st.session_state.get("vectorstore") is not None:
+    keyword_only_search = st.sidebar.toggle(get_text("keyword_search_toggle"), help=get_text("keyword_search_help"))
+else:
+    keyword_only_search = False
+retrieval_mode = RETRIEVAL_KEYWORD if keyword_only_search else RAG_RETRIEVAL_MODE
+
+
+@st.cache_resource
+def get_answer_cache():
+    # Process-wide, so a question answered for one user is reused for the next
+    return AnswerCache(
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        semantic=ANSWER_CACHE_SEMANTIC,
+        similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD
+    )
+
+
+@st.cache_resource
+def get_ingestion_jobs():
+    # The worker outlives every session, so it gets its own embedder and knowledge base handle
+    embedding_cache_store = get_embedding_cache_store()
+    keyword_index = get_keyword_index()
+    manifest = get_ingestion_manifest()
+    recorder = get_metrics_recorder()
+    answer_cache = get_answer_cache()
+    scheduler = get_request_scheduler()
+
+    def run_job(files, on_progress, cancel_event, skip_stored, profile):
+        # Document embedding yields to questions users are waiting on
+        embeddings = CachedEmbeddings(
+            ScheduledEmbeddings(
+                get_ollama_embeddings(),
+                scheduler,
+                EMBEDDING_MODEL,
+                "ingestion",
+                priority=PRIORITY_BULK
+            ),
+            embedding_cache_store
+        )
+        vectorstore = open_vectorstore(embeddings)
+        return ingest_files(
+            files,
+            vectorstore,
+            embeddings,
+            # Split the way the mode the files were uploaded in asks for
+            settings=replace(INGESTION_SETTINGS,
+                             chunking=RAG_MODE_PROFILES.get(profile, RAG_MODE_PROFILES["general"])["chunking"]),
+            manifest=manifest,
+            on_progress=on_progress,
+            recorder=recorder,
+            cancel_event=cancel_event,
+            skip_stored=skip_stored,
+            keyword_index=keyword_index
+        )
+
+    def on_job_finished(job):
+        if job.result.chunks_written or job.result.chunks_removed:
+            answer_cache.invalidate() # Cached answers may no longer match the knowledge base
+
+    return IngestionJobQueue(INGESTION_SPOOL_DIRECTORY, run_job, on_finished=on_job_finished)
+
 
 def process_documents(uploaded_files):
-    if st.session_state.vectorstore is None:
+    if st.session_state.embeddings is None:
         st.error(get_text("rag_not_initialized_error"))
         return
 
-    documents = []
-    
-    # Progress bar for file loading
-    loading_progress_bar = st.sidebar.progress(0, text=get_text("loading_files_progress"))
-    
-    for i, uploaded_file in enumerate(uploaded_files):
-        file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-        
-        # Save uploaded file to a temporary location
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
+    # Hand the files to the background worker; progress is shown by show_ingestion_jobs()
+    files = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    get_ingestion_jobs().submit(files, profile=rag_profile_name)
 
-        try:
-            if file_extension == ".pdf":
-                loader = PyPDFLoader(tmp_file_path)
-            elif file_extension == ".txt" or file_extension == ".md":
-                loader = TextLoader(tmp_file_path, encoding="utf-8")
-            else:
-                st.warning(get_text("unsupported_file_type_warning").format(file_extension=file_extension, file_name=uploaded_file.name))
-                continue
-            
-            docs = loader.load()
-            if not docs or not any(d.page_content.strip() for d in docs): # Check if any content is extracted
-                st.warning(get_text("no_text_extracted_warning").format(file_name=uploaded_file.name))
-            documents.extend(docs)
-        except Exception as e:
-            st.error(get_text("file_loading_failed_error").format(file_name=uploaded_file.name, e=e))
-        finally:
-            os.remove(tmp_file_path) # Clean up temp file
-        
-        loading_progress_bar.progress((i + 1) / len(uploaded_files), text=get_text("loading_files_progress") + f" {i+1}/{len(uploaded_files)}...")
-    
-    loading_progress_bar.empty() # Clear loading progress bar
-
-    if documents:
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        splits = text_splitter.split_documents(documents)
-        
-        if splits:
-            # Progress bar for embedding and adding to vectorstore
-            embedding_progress_bar = st.sidebar.progress(0, text=get_text("processing_docs_progress"))
-            total_splits = len(splits)
-            
-            # Add documents in batches to show progress
-            batch_size = 20 # Adjust batch size based on memory
-            for i in range(0, total_splits, batch_size):
-                batch_splits = splits[i:min(i + batch_size, total_splits)]
-                try:
-                    st.session_state.vectorstore.add_documents(batch_splits)
-                except Exception as e:
-                    st.error(get_text("add_docs_failed_error").format(e=e))
-                    break # Stop if a batch fails
-                
-                progress = (i + len(batch_splits)) / total_splits
-                embedding_progress_bar.progress(progress, text=get_text("processing_docs_progress") + f": {int(progress*100)}%")
-            
-            st.session_state.vectorstore.persist() # Save changes to disk
-            embedding_progress_bar.empty() # Clear embedding progress bar
-            st.success(get_text("docs_added_success").format(num_splits=len(splits)))
+
+def show_ingestion_result(result, complete=True):
+    for kind, file_name, detail in result.file_issues:
+        if kind == "unsupported":
+            st.warning(get_text("unsupported_file_type_warning").format(file_extension=detail, file_name=file_name))
+        elif kind == "empty":
+            st.warning(get_text("no_text_extracted_warning").format(file_name=file_name))
+        elif kind == "duplicate":
+            st.warning(get_text("duplicate_file_name_warning").format(file_name=file_name))
         else:
+            st.error(get_text("file_loading_failed_error").format(file_name=file_name, e=detail))
+
+    for file_name, stored_as in result.files_skipped:
+        st.info(get_text("file_already_ingested_info").format(file_name=file_name, stored_as=stored_as))
+
+    if result.chunks_written:
+        st.success(get_text("docs_added_success").format(num_splits=result.chunks_written))
+    if result.chunks_unchanged or result.chunks_removed:
+        st.info(get_text("docs_updated_info").format(
+            num_unchanged=result.chunks_unchanged,
+            num_removed=result.chunks_removed
+        ))
+    # Nothing written and nothing already up to date: tell the user why
+    up_to_date = result.files_skipped or result.chunks_unchanged or result.chunks_removed
+    if complete and not result.chunks_written and not up_to_date:
+        if result.files_done > len(result.file_issues):
             st.warning(get_text("no_valid_text_blocks_warning"))
-    else:
-        st.info(get_text("no_docs_processed_info"))
+        else:
+            st.info(get_text("no_docs_processed_info"))
 
 
 uploaded_files = st.sidebar.file_uploader(
@@ -364,26 +848,77 @@ uploaded_files = st.sidebar.file_uploader(
     accept_multiple_files=True,
     help=get_text("upload_docs_help")
 )
+st.sidebar.caption(get_text("chunking_profile_caption").format(
+    mode=selected_mode, chunk_tokens=rag_profile["chunking"].chunk_tokens, top_k=rag_profile["top_k"]
+))
 
 if uploaded_files:
     if st.sidebar.button(get_text("process_uploaded_files_button"), key="process_files_btn"):
         process_documents(uploaded_files)
 
-# Clear ChromaDB persistent directory as well
+ingestion_jobs = get_ingestion_jobs() if st.session_state.embeddings is not None else None
+
+@st.fragment(run_every="1s" if ingestion_jobs and ingestion_jobs.has_active() else None)
+def show_ingestion_jobs():
+    # Polls the background worker while a job is queued or running; chatting is not blocked meanwhile
+    for job in ingestion_jobs.jobs():
+        result = job.result
+        st.markdown(get_text("ingestion_job_label").format(job_id=job.job_id, num_files=len(job.file_names)))
+        if job.status == JOB_QUEUED:
+            st.caption(get_text("ingestion_job_queued").format(position=ingestion_jobs.position(job.job_id)))
+        elif job.status == JOB_RUNNING:
+            # Average of parsed files and stored chunks (the chunk total is only known once parsing ends)
+            files_fraction = result.files_done / max(result.files_total, 1)
+            chunks_fraction = result.chunks_written / result.chunks_parsed if result.chunks_parsed else 0
+            if result.files_done or result.chunks_parsed:
+                progress_text = get_text("ingestion_progress").format(
+                    files_done=result.files_done,
+                    files_total=result.files_total,
+                    num_splits=result.chunks_embedded
+                )
+            else:
+                progress_text = get_text("loading_files_progress")
+            st.progress(min((files_fraction + chunks_fraction) / 2, 1.0), text=progress_text)
+            if job.cancel_event.is_set():
+                st.caption(get_text("ingestion_job_cancelling"))
+        else:
+            if job.status == JOB_CANCELLED:
+                st.info(get_text("ingestion_job_cancelled"))
+            elif job.status == JOB_FAILED:
+                st.error(get_text("add_docs_failed_error").format(e=job.error))
+            show_ingestion_result(result, complete=job.status == JOB_DONE)
+
+        if job.active:
+            if not job.cancel_event.is_set():
+                st.button(get_text("ingestion_job_cancel_button"), key=f"cancel_job_{job.job_id}",
+                          on_click=ingestion_jobs.cancel, args=(job.job_id,))
+        else:
+            if job.status in (JOB_CANCELLED, JOB_FAILED):
+                if st.button(get_text("ingestion_job_resume_button"), key=f"resume_job_{job.job_id}"):
+                    ingestion_jobs.resume(job.job_id)
+                    st.rerun() # Full rerun, so this panel starts polling again
+            st.button(get_text("ingestion_job_dismiss_button"), key=f"dismiss_job_{job.job_id}",
+                      on_click=ingestion_jobs.remove, args=(job.job_id,))
+
+if ingestion_jobs is not None:
+    with st.sidebar:
+        show_ingestion_jobs()
+
+# Clear the collection and everything derived from it
 if st.sidebar.button(get_text("clear_knowledge_base_button"), key="clear_db_btn"):
-    if st.session_state.vectorstore:
+    if ingestion_jobs is not None and ingestion_jobs.has_active():
+        st.sidebar.warning(get_text("clear_knowledge_base_busy_warning"))
+    elif st.session_state.vectorstore:
         try:
             st.session_state.vectorstore.delete_collection() # Deletes all data in the collection
-            if os.path.exists(PERSIST_DIRECTORY):
-                shutil.rmtree(PERSIST_DIRECTORY) # Remove the directory itself
-                os.makedirs(PERSIST_DIRECTORY) # Recreate empty directory for future use
-
-            # Re-initialize the vectorstore
-            if st.session_state.embeddings: # Only if embeddings are available
-                st.session_state.vectorstore = Chroma(
-                    embedding_function=st.session_state.embeddings,
-                    persist_directory=st.session_state.chroma_db_dir
-                )
+            get_ingestion_manifest().clear() # Forget file hashes so re-uploads are ingested again
+            get_answer_cache().invalidate()
+            get_keyword_index().clear()
+            # The shared client keeps its files open, so the folder stays; every session reopens
+            # the new, empty collection on its next run
+            get_knowledge_base_version()["version"] += 1
+            st.session_state.vectorstore = open_vectorstore(st.session_state.embeddings)
+            st.session_state.knowledge_base_version = get_knowledge_base_version()["version"]
             st.success(get_text("clear_knowledge_base_success"))
         except Exception as e:
             st.error(get_text("clear_knowledge_base_failed").format(e=e))
@@ -395,6 +930,52 @@ st.sidebar.markdown(get_text("divider") + "\n")
 st.sidebar.info(get_text("offline_app_info"))
 
 
+# --- Diagnostics: rolling latency percentiles from the metrics recorder ---
+# (label, event kind, field); kinds are recorded by the chat handler and the ingestion pipeline
+DIAGNOSTIC_METRICS = [
+    ("diagnostics_ttft", "chat_turn", "ttft_ms"),
+    ("diagnostics_model_load", "chat_turn", "load_ms"),
+    ("diagnostics_prefill", "chat_turn", "prompt_eval_ms"),
+    ("diagnostics_decode_speed", "chat_turn", "tokens_per_sec"),
+    ("diagnostics_total_turn", "chat_turn", "total_ms"),
+    ("diagnostics_retrieval", "chat_turn", "retrieval_ms"),
+    ("diagnostics_queue_wait", "scheduler_wait", "wait_ms"),
+    ("diagnostics_embed_batch", "embed_batch", "duration_ms"),
+    ("diagnostics_parse_file", "parse_file", "duration_ms"),
+    ("diagnostics_ingestion_speed", "ingestion", "chunks_per_sec"),
+]
+
+with st.sidebar.expander(get_text("diagnostics_title")):
+    recorder = get_metrics_recorder()
+    rows = []
+    for label_key, kind, field in DIAGNOSTIC_METRICS:
+        summary = recorder.rolling_summary(kind, field)
+        if summary["count"]:
+            rows.append({
+                get_text("diagnostics_metric"): get_text(label_key),
+                get_text("diagnostics_samples"): summary["count"],
+                "p50": round(summary["p50"], 1),
+                "p95": round(summary["p95"], 1),
+                "p99": round(summary["p99"], 1)
+            })
+    if rows:
+        st.table(rows)
+        st.caption(get_text("diagnostics_log_location").format(path=METRICS_LOG_PATH))
+    else:
+        st.caption(get_text("diagnostics_empty"))
+
+    # Requests running and queued per model, as of this rerun
+    scheduler_load = get_request_scheduler().load()
+    if scheduler_load:
+        st.markdown(get_text("diagnostics_scheduler_title"))
+        st.table([{
+            get_text("diagnostics_scheduler_model"): model,
+            get_text("diagnostics_scheduler_active"): active,
+            get_text("diagnostics_scheduler_limit"): limit,
+            get_text("diagnostics_scheduler_waiting"): waiting
+        } for model, (active, limit, waiting) in sorted(scheduler_load.items())])
+
+
 # --- "About" / Help Section ---
 with st.sidebar.expander(get_text("about_help_title")):
     st.markdown(f"""
@@ -425,19 +1006,77 @@ with st.sidebar.expander(get_text("about_help_title")):
     """)
 
 
-# --- Initialize Session State (to store conversation history) ---
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+def apply_memory_compaction():
+    # Take up the last finished summary; one still being written is picked up on a later turn
+    pending = st.session_state.get("memory_compaction")
+    if pending is None or not pending.done():
+        return
+    st.session_state.memory_compaction = None
+    try:
+        result = pending.result()
+    except Exception:
+        return # The sliding window alone still keeps the prompt bounded
+    memory = st.session_state.memory
+    # Skipped if the session moved to another conversation or was cleared meanwhile
+    if result is not None and result[:2] == (st.session_state.conversation_id, memory.summarized_count):
+        memory.summary, memory.summarized_count = result[2:]
+
+
+def start_memory_compaction():
+    # Fold turns that left the window into the summary on the compactor thread, so the user can
+    # ask the next question straight away; the summary is saved as soon as it is written
+    apply_memory_compaction()
+    if st.session_state.get("memory_compaction") is not None or not st.session_state.memory.needs_compaction(
+            st.session_state.messages):
+        return
+    memory = copy.copy(st.session_state.memory)
+    messages = list(st.session_state.messages)
+    conversation_id, owner = st.session_state.conversation_id, st.session_state.conversation_owner
+    summarized_count = memory.summarized_count
+    client = ScheduledClient(get_request_scheduler(), st.session_state.session_id, priority=PRIORITY_BACKGROUND)
+    model, request_template = selected_model, get_text("memory_summary_request")
+    store = get_conversation_store()
+
+    def summarize(previous_summary, to_fold, max_tokens):
+        return summarize_chat(model, request_template, previous_summary, to_fold, max_tokens,
+                              client=client, keep_alive=MODEL_KEEP_ALIVE_SECONDS)
+
+    def compact():
+        if not memory.compact(messages, summarize):
+            return None
+        store.save_memory_state(conversation_id, owner, memory.summary, memory.summarized_count)
+        return conversation_id, summarized_count, memory.summary, memory.summarized_count
+
+    st.session_state.memory_compaction = get_memory_compactor().submit(compact)
+
 
 # --- Display Previous Messages ---
-for message in st.session_state.messages:
+def show_cache_indicator(cache_status):
+    if cache_status == HIT_EXACT:
+        st.caption(get_text("answer_cache_hit_exact"))
+    elif cache_status == HIT_SEMANTIC:
+        st.caption(get_text("answer_cache_hit_semantic"))
+    elif cache_status == MISS:
+        st.caption(get_text("answer_cache_miss"))
+
+# Only the newest messages are rendered; a long history is paged in on request
+hidden_messages = max(0, len(st.session_state.messages) - st.session_state.shown_messages)
+if hidden_messages and st.button(
+    get_text("show_earlier_messages_button").format(count=min(hidden_messages, CHAT_PAGE_MESSAGES)),
+    help=get_text("show_earlier_messages_help").format(count=hidden_messages)
+):
+    st.session_state.shown_messages += CHAT_PAGE_MESSAGES
+    st.rerun()
+
+for message in st.session_state.messages[hidden_messages:]:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
+        show_cache_indicator(message.get("cache"))
 
 # --- Chat Input ---
 if prompt := st.chat_input(get_text("chat_input_placeholder")):
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    save_message({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
@@ -447,31 +1086,87 @@ if prompt := st.chat_input(get_text("chat_input_placeholder")):
         message_placeholder = st.empty()
         full_response = ""
         with st.spinner(get_text("thinking_spinner")):
+            apply_memory_compaction()
+            history = st.session_state.memory.build_history(st.session_state.messages)
+
+            # Repeated questions are answered from the cache; the key includes the conversation so far
+            answer_cache = get_answer_cache()
+            cache_scope = (selected_mode, selected_model, temperature, retrieval_mode)
+            cache_context = conversation_fingerprint(st.session_state.memory.summary, history[:-1])
+            embeddings = st.session_state.get("embeddings")
+            # Keyword-only search promises no embedding call, so it only gets exact cache hits
+            use_semantic_cache = ANSWER_CACHE_SEMANTIC and embeddings and retrieval_mode != RETRIEVAL_KEYWORD
+            query_embed_fn = embeddings.embed_query if use_semantic_cache else None
+            cached_answer, cache_status = None, MISS
             try:
-                # Call Ollama API to get response from selected model
-                stream = ollama.chat(
-                    model=selected_model, # Use the selected model from sidebar
-                    messages=[
-                        {"role": m["role"], "content": m["content"]}
-                        for m in st.session_state.messages
-                    ],
-                    stream=True, # Enable streaming responses
-                    options=dict(temperature=temperature) # Apply temperature setting
-                )
+                cached_answer, cache_status = answer_cache.lookup(prompt, cache_scope, cache_context, query_embed_fn)
+            except Exception:
+                pass # A failed semantic lookup just means a normal generation
 
-                for chunk in stream:
-                    if 'content' in chunk['message']:
-                        full_response += chunk['message']['content']
-                        # Update the placeholder with the current full response and a blinking cursor
-                        message_placeholder.markdown(full_response + "▌")
-                # After streaming is complete, display the final response without the cursor
+            if cached_answer is not None:
+                full_response = cached_answer
                 message_placeholder.markdown(full_response)
+                get_metrics_recorder().record("answer_cache_hit", cache=cache_status, model=selected_model)
+            else:
+                turn_stats = {}
+                renderer = StreamRenderer(
+                    message_placeholder,
+                    interval=STREAM_RENDER_INTERVAL_SECONDS,
+                    max_pending=STREAM_RENDER_MAX_PENDING
+                )
+                # Waits its turn behind other sessions' answers, showing its place in the queue meanwhile
+                client = ScheduledClient(
+                    get_request_scheduler(),
+                    st.session_state.session_id,
+                    on_wait=lambda position: message_placeholder.markdown(
+                        get_text("scheduler_waiting").format(position=position)
+                    )
+                )
+                try:
+                    # Retrieve knowledge base context and stream the selected model's answer
+                    for piece in stream_chat_turn(
+                        selected_model, # Use the selected model from sidebar
+                        system_instruction,
+                        history,
+                        prompt,
+                        temperature,
+                        vectorstore=st.session_state.get("vectorstore"),
+                        summary=st.session_state.memory.summary,
+                        top_k=rag_profile["top_k"],
+                        token_budget=RAG_CONTEXT_TOKEN_BUDGET,
+                        keyword_index=get_keyword_index(),
+                        retrieval_mode=retrieval_mode,
+                        context_template=get_text("rag_context_prompt"),
+                        summary_template=get_text("conversation_summary_prompt"),
+                        on_retrieval_error=lambda e: st.warning(get_text("retrieval_failed_warning").format(e=e)),
+                        client=client,
+                        turn_stats=turn_stats,
+                        keep_alive=MODEL_KEEP_ALIVE_SECONDS
+                    ):
+                        # Buffered; the placeholder is only re-rendered on the renderer's cadence
+                        renderer.add(piece)
+                    # After streaming is complete, display the final response without the cursor
+                    full_response = renderer.finish()
+                    get_metrics_recorder().record("chat_turn", model=selected_model, **turn_stats)
 
-                # Add assistant message to chat history
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
+                    if full_response.strip():
+                        try:
+                            answer_cache.store(prompt, cache_scope, full_response, cache_context, query_embed_fn)
+                        except Exception:
+                            pass # Caching is best effort
+                except SchedulerBusyError:
+                    message_placeholder.empty()
+                    st.warning(get_text("scheduler_busy_warning"))
+                    full_response = ""
+                except Exception as e:
+                    st.error(get_text("model_interaction_error").format(e=e))
+                    st.warning(get_text("ollama_service_check_warning"))
+                    full_response = ""
 
-            except Exception as e:
-                st.error(get_text("model_interaction_error").format(e=e))
-                st.warning(get_text("ollama_service_check_warning"))
+            if full_response:
+                show_cache_indicator(cache_status)
+                # Add assistant message to chat history
+                save_message({"role": "assistant", "content": full_response, "cache": cache_status})
+                start_memory_compaction()
 
 st.divider() # Another visual separator
\ No newline at end of file
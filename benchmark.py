@@ -0,0 +1,617 @@
+"""Headless benchmark for the chat, ingestion, chunking, retrieval, vector store and app startup paths.
+
+Runs the same code the Streamlit app uses (chat_engine, memory, ingestion, retrieval,
+Chroma) against a local stub Ollama server with deterministic latency, so numbers are
+comparable between runs and machines without a GPU or the real daemon.
+
+Examples:
+    python benchmark.py all --output bench_report.json
+    python benchmark.py chat --stub-token-rate 15 --stub-load-ms 2000
+    python benchmark.py ingest --docs 500 --paragraphs 40
+    python benchmark.py chunking --docs 200           # embeddings, index size and hit rate per mode's chunking profile
+    python benchmark.py vectors --docs 2000            # recall, latency and size of the vector backends
+    python benchmark.py startup --startup-runs 5
+    python benchmark.py all --ollama-host http://127.0.0.1:11434   # real daemon instead of the stub
+    python benchmark.py all --baseline bench_report.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from collections import OrderedDict
+
+from metrics import summarize
+from retrieval import estimate_tokens
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROMPTS_PATH = os.path.join(current_dir, "benchmarks", "prompts.jsonl")
+
+# Short stand-ins for the app's per-mode system instructions
+MODE_INSTRUCTIONS = {
+    "general": "You are a helpful assistant. Please answer questions based on the provided context information (if any) and conversation history.",
+    "agriculture": "You are an experienced agricultural expert. Give practical advice on planting, pest and disease control and yield.",
+    "medical": "You are a basic medical information assistant. You cannot replace professional diagnosis; advise seeing a doctor when needed.",
+    "weather": "You are a weather and disaster alert assistant. Give warnings and emergency response suggestions.",
+    "education": "You are a popularizer of basic education knowledge. Explain concepts in simple, clear language."
+}
+
+# Per-mode chunk size in tokens and top k, as in RAG_MODE_PROFILES in app.py
+MODE_CHUNKING = {
+    "general": (256, 4),
+    "agriculture": (256, 4),
+    "medical": (192, 5),
+    "weather": (160, 4),
+    "education": (384, 3)
+}
+
+_CORPUS_TOPICS = {
+    "agriculture": "wheat maize rice tomato leaf rust blight fungicide mancozeb propiconazole irrigation compost fertilizer urea seedling harvest pest aphid locust soil",
+    "medical": "fever malaria dehydration oral rehydration paracetamol amoxicillin wound dressing burn fracture clinic vaccination cholera diarrhoea cough",
+    "weather": "flood cyclone landslide earthquake drought shelter evacuation route warning siren rainfall river level FL-3 EQ-2 emergency kit",
+    "education": "photosynthesis gravity fraction multiplication continent river ocean history alphabet reading experiment energy planet season"
+}
+_FILLER = ("the a of to and in is for on with should be can when use each after before check keep "
+           "local area field team family water day week month").split()
+
+
+# --- Inputs ---
+def load_prompt_sessions(path):
+    # JSONL lines of {"session", "mode", "prompt"}; turns keep file order within a session
+    sessions = OrderedDict()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            session = sessions.setdefault(record.get("session", "default"), {"mode": record.get("mode", "general"),
+                                                                               "prompts": []})
+            session["prompts"].append(record["prompt"])
+    return sessions
+
+
+def synthetic_corpus(num_docs, paragraphs_per_doc, seed=0):
+    # Deterministic Markdown/text documents with topic-specific terms for retrieval to find
+    rng = random.Random(seed)
+    topics = list(_CORPUS_TOPICS)
+    files = []
+    for i in range(num_docs):
+        topic = topics[i % len(topics)]
+        terms = _CORPUS_TOPICS[topic].split()
+        paragraphs = [f"# {topic.title()} manual {i}"]
+        for p in range(paragraphs_per_doc):
+            words = [rng.choice(terms) if rng.random() < 0.3 else rng.choice(_FILLER) for _ in range(rng.randint(60, 140))]
+            paragraphs.append(f"## Section {p}\n" + " ".join(words) + ".")
+        extension = ".md" if i % 2 else ".txt"
+        files.append((f"{topic}_{i:04d}{extension}", "\n\n".join(paragraphs).encode("utf-8")))
+    return files
+
+
+def synthetic_pdf(text, line_chars=90, lines_per_page=56):
+    # A minimal PDF of a synthetic document as text extraction sees real ones: hard-wrapped
+    # lines, no blank lines, and plain numbered or all-caps heading lines
+    lines = []
+    section = 0
+    for block in text.split("\n\n"):
+        for line in block.split("\n"):
+            if line.startswith("## "):
+                section += 1
+                lines.append(f"{section}. {line[3:]}")
+            elif line.startswith("# "):
+                lines.append(line[2:].upper())
+            else:
+                lines.extend(textwrap.wrap(line, line_chars))
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    def escape(line):
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))}] "
+               f"/Count {len(pages)} >>".encode(),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, page in enumerate(pages):
+        content = "BT /F1 9 Tf 40 800 Td 13 TL " + " ".join(f"({escape(line)}) '" for line in page) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode())
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+# --- Benchmarks ---
+def bench_ingestion(files, vectorstore, embeddings, settings, manifest, keyword_index=None):
+    from ingestion import ingest_files
+
+    report = {"files": len(files), "bytes": sum(len(data) for _, data in files)}
+    for label in ("first_pass", "reupload_unchanged"):
+        started = time.perf_counter()
+        result = ingest_files(files, vectorstore, embeddings, settings=settings, manifest=manifest,
+                              keyword_index=keyword_index)
+        seconds = time.perf_counter() - started
+        if result.error is not None:
+            raise RuntimeError(f"ingestion failed: {result.error}")
+        report[label] = {
+            "seconds": seconds,
+            "chunks_written": result.chunks_written,
+            "files_skipped": len(result.files_skipped),
+            "files_per_sec": len(files) / seconds if seconds else None,
+            "chunks_per_sec": result.chunks_written / seconds if seconds else None
+        }
+    return report
+
+
+def bench_retrieval(vectorstore, prompts, top_k, token_budget, repeats=1, keyword_index=None):
+    from retrieval import DEFAULT_RETRIEVAL_MODE, RETRIEVAL_HYBRID, RETRIEVAL_KEYWORD, RETRIEVAL_VECTOR, retrieve_context
+
+    # Embed every prompt once before timing any mode. With the embedding cache, whichever mode ran
+    # first would otherwise pay for every query embedding; that cost is reported on its own instead
+    embed_latencies = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        vectorstore.embeddings.embed_query(prompt)
+        embed_latencies.append((time.perf_counter() - started) * 1000)
+
+    # The top-level numbers are for the app's default mode; "by_mode" compares all three
+    by_mode = {}
+    modes = (RETRIEVAL_VECTOR, RETRIEVAL_HYBRID, RETRIEVAL_KEYWORD) if keyword_index is not None else (RETRIEVAL_VECTOR,)
+    for mode in modes:
+        latencies = []
+        hits = 0
+        for _ in range(repeats):
+            for prompt in prompts:
+                started = time.perf_counter()
+                documents = retrieve_context(vectorstore, prompt, top_k=top_k, token_budget=token_budget,
+                                             keyword_index=keyword_index, mode=mode)
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += bool(documents)
+        by_mode[mode] = {"queries": len(latencies), "with_context": hits, "latency_ms": summarize(latencies)}
+    report = dict(by_mode.get(DEFAULT_RETRIEVAL_MODE, by_mode[RETRIEVAL_VECTOR]))
+    report["by_mode"] = by_mode
+    report["query_embedding_ms"] = summarize(embed_latencies)
+    return report
+
+
+def _directory_bytes(path, exclude=()):
+    total = 0
+    for root, _, names in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names if name not in exclude)
+    return total
+
+
+def bench_vector_store(vectorstore, embeddings, files, settings, workdir, prompts, k, rerank_factor, probe_lists,
+                       seed=0):
+    # Recall of Chroma (HNSW) and the quantized store against an exact float32 search of the same vectors
+    import numpy as np
+    from ingestion import ingest_files
+    from quantized_store import QuantizedIndex, QuantizedVectorStore
+
+    quantized = QuantizedVectorStore(QuantizedIndex(os.path.join(workdir, "quantized"), rerank_factor=rerank_factor,
+                                                    probe_lists=probe_lists), embeddings)
+    started = time.perf_counter()
+    result = ingest_files(files, quantized, embeddings, settings=settings)
+    if result.error is not None:
+        raise RuntimeError(f"quantized ingestion failed: {result.error}")
+    quantized_ingest_seconds = time.perf_counter() - started
+
+    stored = vectorstore._collection.get(include=["embeddings", "documents"])
+    ids = stored["ids"]
+    matrix = np.asarray(stored["embeddings"], dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    # Recorded prompts plus the opening words of sampled chunks, so most queries have close neighbours
+    rng = random.Random(seed)
+    sampled = rng.sample(stored["documents"], min(200, len(ids)))
+    queries = [embeddings.embed_query(text) for text in list(prompts) + [" ".join(doc.split()[:12]) for doc in sampled]]
+
+    truth = []
+    for query in queries:
+        scores = matrix @ (np.asarray(query, dtype=np.float32) / max(np.linalg.norm(query), 1e-12))
+        truth.append({ids[i] for i in np.argsort(-scores)[:k]})
+
+    report = {"chunks": len(ids), "dim": matrix.shape[1], "queries": len(queries), "k": k}
+    backends = (("chroma", vectorstore, _directory_bytes(os.path.join(workdir, "chroma"), ("keyword_index.sqlite3",))),
+                ("quantized", quantized, _directory_bytes(os.path.join(workdir, "quantized"))))
+    for name, store, disk_bytes in backends:
+        latencies = []
+        found = 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            documents = store.similarity_search_by_vector(query, k=k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found += len(expected & {doc.id for doc in documents})
+        report[name] = {
+            "recall_at_k": found / (len(queries) * min(k, len(ids))) if ids else None,
+            "latency_ms": summarize(latencies),
+            "disk_bytes": disk_bytes,
+            "disk_bytes_per_chunk": disk_bytes / len(ids) if ids else None
+        }
+    report["quantized"]["rerank_factor"] = rerank_factor
+    report["quantized"]["probe_lists"] = probe_lists
+    report["quantized"]["ingest_seconds"] = quantized_ingest_seconds
+    return report
+
+
+def _chunking_run(files, embeddings, settings, directory, profile, queries, query_vectors, ks):
+    # Ingest `files` under one chunking profile; hit rate is how often a quoted passage is in the top k
+    from dataclasses import replace
+    from ingestion import ingest_files
+    from langchain_chroma import Chroma
+
+    vectorstore = Chroma(embedding_function=embeddings, persist_directory=directory)
+    started = time.perf_counter()
+    result = ingest_files(files, vectorstore, embeddings, settings=replace(settings, chunking=profile))
+    if result.error is not None:
+        raise RuntimeError(f"ingestion failed: {result.error}")
+    seconds = time.perf_counter() - started
+    documents = vectorstore._collection.get(include=["documents"])["documents"]
+    found = dict.fromkeys(ks, 0)
+    for query, vector in zip(queries, query_vectors):
+        retrieved = [" ".join(doc.page_content.split())
+                     for doc in vectorstore.similarity_search_by_vector(vector, k=max(ks))]
+        for k in ks:
+            found[k] += any(query in text for text in retrieved[:k])
+    # Drop the pages Chroma's write queue freed, so the size reflects what is stored
+    with sqlite3.connect(os.path.join(directory, "chroma.sqlite3")) as connection:
+        connection.execute("VACUUM")
+    return {
+        "chunks": len(documents),
+        "embedded_tokens": sum(estimate_tokens(text) for text in documents),
+        "index_bytes": _directory_bytes(directory),
+        "hit_rate": {k: found[k] / len(queries) for k in ks},
+        "ingest_seconds": seconds
+    }
+
+
+def bench_chunking(embeddings, settings, workdir, num_docs, paragraphs, seeds, num_queries=1000):
+    # The previous fixed 1000/200-character splitter (used by every mode) against each mode's
+    # structure-aware profile: embedding count, index size and hit rate at the mode's top k,
+    # per corpus seed and averaged over them
+    from chunking import DOCUMENT_MARKDOWN, DOCUMENT_PDF, DOCUMENT_TEXT, STRATEGY_RECURSIVE, ChunkingProfile
+
+    recursive = ChunkingProfile(chunk_tokens=250, strategy=STRATEGY_RECURSIVE,
+                                overlap_tokens={DOCUMENT_MARKDOWN: 50, DOCUMENT_TEXT: 50, DOCUMENT_PDF: 50})
+    sizes = sorted({chunk_tokens for chunk_tokens, _ in MODE_CHUNKING.values()})
+    ks = sorted({top_k for _, top_k in MODE_CHUNKING.values()})
+    runs = []
+    for seed in seeds:
+        files = synthetic_corpus(num_docs, paragraphs, seed=seed)
+        rng = random.Random(seed)
+        queries = []
+        for _ in range(num_queries):
+            _, data = rng.choice(files)
+            paragraph = rng.choice([line for line in data.decode("utf-8").splitlines() if len(line.split()) > 30])
+            words = paragraph.split()
+            start = rng.randrange(len(words) - 12)
+            queries.append(" ".join(words[start:start + 12]))
+        query_vectors = embeddings.embed_documents(queries)
+        # Every third document as a PDF, where line wrapping brings the old splitter's overlap into play
+        files = [(os.path.splitext(name)[0] + ".pdf", synthetic_pdf(data.decode("utf-8"))) if i % 3 == 0
+                 else (name, data) for i, (name, data) in enumerate(files)]
+        run = {"recursive_1000_200": _chunking_run(files, embeddings, settings,
+                                                   os.path.join(workdir, f"chunking_{seed}_recursive"),
+                                                   recursive, queries, query_vectors, ks)}
+        for chunk_tokens in sizes:
+            run[chunk_tokens] = _chunking_run(files, embeddings, settings,
+                                              os.path.join(workdir, f"chunking_{seed}_{chunk_tokens}"),
+                                              ChunkingProfile(chunk_tokens=chunk_tokens), queries, query_vectors, ks)
+        runs.append(run)
+
+    def averaged(key, k):
+        results = [run[key] for run in runs]
+        report = {metric: sum(result[metric] for result in results) / len(results)
+                  for metric in ("chunks", "embedded_tokens", "index_bytes", "ingest_seconds")}
+        report["hit_rate_at_k"] = sum(result["hit_rate"][k] for result in results) / len(results)
+        report["by_seed"] = [{"chunks": result["chunks"], "hit_rate_at_k": result["hit_rate"][k]} for result in results]
+        return report
+
+    report = {"queries": num_queries, "seeds": list(seeds), "by_mode": {}}
+    for mode, (chunk_tokens, top_k) in MODE_CHUNKING.items():
+        report["by_mode"][mode] = {"chunk_tokens": chunk_tokens, "top_k": top_k,
+                                   "recursive_1000_200": averaged("recursive_1000_200", top_k),
+                                   "structured": averaged(chunk_tokens, top_k)}
+    # The general mode's pair at the top level, for the regression check
+    report["recursive_1000_200"] = report["by_mode"]["general"]["recursive_1000_200"]
+    report["structured"] = report["by_mode"]["general"]["structured"]
+    return report
+
+
+def bench_chat(sessions, client, model, vectorstore, args, keyword_index=None):
+    from chat_engine import stream_chat_turn, summarize_conversation
+    from memory import ConversationMemory
+
+    ttft, totals, rates, compactions = [], [], [], 0
+    server = {"load_ms": [], "prompt_eval_ms": [], "tokens_per_sec": []}
+    for name, session in sessions.items():
+        memory = ConversationMemory(window_tokens=args.memory_window_tokens)
+        messages = []
+        instruction = MODE_INSTRUCTIONS.get(session["mode"], MODE_INSTRUCTIONS["general"])
+        for prompt in session["prompts"]:
+            messages.append({"role": "user", "content": prompt})
+            history = memory.build_history(messages)
+            started = time.perf_counter()
+            first = None
+            pieces = 0
+            response = ""
+            turn_stats = {}
+            for piece in stream_chat_turn(model, instruction, history, prompt, args.temperature,
+                                          vectorstore=vectorstore, summary=memory.summary,
+                                          top_k=args.top_k, token_budget=args.token_budget, client=client,
+                                          turn_stats=turn_stats, keyword_index=keyword_index):
+                if first is None:
+                    first = time.perf_counter()
+                pieces += 1
+                response += piece
+            finished = time.perf_counter()
+            messages.append({"role": "assistant", "content": response})
+            if first is not None:
+                ttft.append((first - started) * 1000)
+                if finished > first and pieces > 1:
+                    rates.append((pieces - 1) / (finished - first))
+            totals.append((finished - started) * 1000)
+            for key, values in server.items():
+                if key in turn_stats:
+                    values.append(turn_stats[key])
+            compactions += memory.compact(
+                messages,
+                lambda summary, folded, max_tokens: summarize_conversation(
+                    model, "Summarize in {max_words} words:\n{summary}\n{transcript}",
+                    summary, folded, max_tokens, client=client)
+            )
+    return {
+        "sessions": len(sessions),
+        "turns": len(totals),
+        "summary_compactions": compactions,
+        "ttft_ms": summarize(ttft),
+        "total_ms": summarize(totals),
+        "tokens_per_sec": summarize(rates),
+        # As reported by the server in its final chunk
+        "server_load_ms": summarize(server["load_ms"]),
+        "server_prefill_ms": summarize(server["prompt_eval_ms"]),
+        "server_tokens_per_sec": summarize(server["tokens_per_sec"])
+    }
+
+
+# Runs in a fresh interpreter per sample, so every import and shared resource starts cold
+_STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=300)
+app.run()
+first = time.perf_counter()
+app.run()
+rerun = time.perf_counter()
+AppTest.from_file(sys.argv[1], default_timeout=300).run()
+second = time.perf_counter()
+print(json.dumps({
+    "errors": [str(e.value) for e in app.exception],
+    "streamlit_import_ms": (imported - started) * 1000,
+    "first_session_ms": (first - imported) * 1000,
+    "rerun_ms": (rerun - first) * 1000,
+    "new_session_ms": (second - rerun) * 1000
+}))
+"""
+
+
+def bench_startup(host, workdir, files, runs):
+    # Copies the app into a scratch folder, so its knowledge base and caches are not the user's
+    from ingestion import IngestionSettings, ingest_files
+    from keyword_index import KeywordIndex
+    from langchain_chroma import Chroma
+    from langchain_ollama import OllamaEmbeddings
+    from manifest import IngestionManifest
+
+    report = {"runs": runs}
+    for scenario in ("empty_knowledge_base", "with_knowledge_base"):
+        app_dir = os.path.join(workdir, f"startup_{scenario}")
+        os.makedirs(app_dir)
+        for name in os.listdir(current_dir):
+            if name.endswith(".py"):
+                shutil.copy(os.path.join(current_dir, name), app_dir)
+        if scenario == "with_knowledge_base":
+            persist_directory = os.path.join(app_dir, "chroma_db_rag")
+            embeddings = OllamaEmbeddings(model="nomic-embed-text", base_url=host)
+            ingest_files(files, Chroma(embedding_function=embeddings, persist_directory=persist_directory),
+                         embeddings, settings=IngestionSettings(parse_workers=0),
+                         manifest=IngestionManifest(os.path.join(app_dir, "chroma_db_rag_manifest.json")),
+                         keyword_index=KeywordIndex(os.path.join(persist_directory, "keyword_index.sqlite3")))
+
+        samples = []
+        for _ in range(runs):
+            completed = subprocess.run(
+                [sys.executable, "-c", _STARTUP_PROBE, os.path.join(app_dir, "app.py")],
+                env=dict(os.environ, OLLAMA_HOST=host), capture_output=True, text=True, check=True
+            )
+            sample = json.loads(completed.stdout.strip().splitlines()[-1])
+            if sample["errors"]:
+                raise RuntimeError(f"app raised during startup: {sample['errors']}")
+            samples.append(sample)
+        report[scenario] = {key: summarize([sample[key] for sample in samples])
+                            for key in ("streamlit_import_ms", "first_session_ms", "rerun_ms", "new_session_ms")}
+    return report
+
+
+# --- Regression check ---
+# (section, metric path, direction): "lower" means bigger values are regressions
+_TRACKED_METRICS = (
+    ("chat", ("ttft_ms", "p95"), "lower"),
+    ("chat", ("total_ms", "p95"), "lower"),
+    ("chat", ("tokens_per_sec", "p50"), "higher"),
+    ("retrieval", ("latency_ms", "p95"), "lower"),
+    ("retrieval", ("by_mode", "keyword", "latency_ms", "p95"), "lower"),
+    ("chunking", ("structured", "hit_rate_at_k"), "higher"),
+    ("chunking", ("structured", "chunks"), "lower"),
+    ("vector_store", ("quantized", "recall_at_k"), "higher"),
+    ("vector_store", ("quantized", "latency_ms", "p95"), "lower"),
+    ("ingestion", ("first_pass", "chunks_per_sec"), "higher"),
+    ("ingestion", ("reupload_unchanged", "seconds"), "lower"),
+    ("startup", ("empty_knowledge_base", "first_session_ms", "p50"), "lower"),
+    ("startup", ("with_knowledge_base", "first_session_ms", "p50"), "lower"),
+    ("startup", ("with_knowledge_base", "new_session_ms", "p50"), "lower")
+)
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    regressions = []
+    for section, path, direction in _TRACKED_METRICS:
+        current, previous = report.get(section), baseline.get(section)
+        for key in path:
+            current = current.get(key) if isinstance(current, dict) else None
+            previous = previous.get(key) if isinstance(previous, dict) else None
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or previous == 0:
+            continue
+        change = (current - previous) / previous
+        if (direction == "lower" and change > tolerance) or (direction == "higher" and change < -tolerance):
+            regressions.append({"metric": ".".join((section,) + path), "baseline": previous,
+                                "current": current, "change": change})
+    return regressions
+
+
+# --- CLI ---
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the chat, ingestion, chunking, retrieval, vector store and startup paths headlessly.")
+    parser.add_argument("suite", nargs="?", default="all", choices=("all", "chat", "ingest", "retrieval", "chunking",
+                                                                       "vectors", "startup"))
+    parser.add_argument("--output", help="Write the JSON report to this file (default: print it)")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against; exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change before a metric counts as a regression")
+    parser.add_argument("--prompts", default=DEFAULT_PROMPTS_PATH, help="Recorded prompt set (JSONL)")
+    parser.add_argument("--docs", type=int, default=40, help="Synthetic corpus size in documents")
+    parser.add_argument("--paragraphs", type=int, default=20, help="Paragraphs per synthetic document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunking-seeds", type=int, default=3, help="Corpora, from --seed on, the chunking suite averages over")
+    parser.add_argument("--model", default="gemma3n:latest")
+    parser.add_argument("--embedding-model", default="nomic-embed-text")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--token-budget", type=int, default=1500)
+    parser.add_argument("--memory-window-tokens", type=int, default=2048)
+    parser.add_argument("--retrieval-repeats", type=int, default=3)
+    parser.add_argument("--vector-k", type=int, default=10, help="Neighbours compared in the vector store recall check")
+    parser.add_argument("--rerank-factor", type=int, default=8, help="Quantized store: candidates re-ranked per result")
+    parser.add_argument("--probe-lists", type=int, default=48, help="Quantized store: closest lists scanned per search")
+    parser.add_argument("--startup-runs", type=int, default=3, help="Fresh app processes started per startup scenario")
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--embed-concurrency", type=int, default=4)
+    parser.add_argument("--embed-batch-size", type=int, default=32)
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Embed without the persistent cache")
+    parser.add_argument("--ollama-host", help="Use this Ollama server instead of starting the stub")
+    parser.add_argument("--stub-load-ms", type=float, default=0.0, help="Stub: one-off model load time")
+    parser.add_argument("--stub-prefill-ms-per-token", type=float, default=0.2)
+    parser.add_argument("--stub-token-rate", type=float, default=30.0, help="Stub: decode tokens per second")
+    parser.add_argument("--stub-response-tokens", type=int, default=64)
+    parser.add_argument("--stub-embed-ms", type=float, default=2.0, help="Stub: embedding time per text")
+    parser.add_argument("--stub-embedding-dim", type=int, default=768)
+    return parser
+
+
+def run(args):
+    import ollama
+    from langchain_chroma import Chroma
+    from langchain_ollama import OllamaEmbeddings
+    from embedding_cache import CachedEmbeddings, EmbeddingCacheStore
+    from ingestion import IngestionSettings
+    from keyword_index import KeywordIndex
+    from manifest import IngestionManifest
+    from stub_ollama import StubOllamaServer, StubSettings
+
+    stub = None
+    host = args.ollama_host
+    if host is None:
+        stub = StubOllamaServer(StubSettings(
+            load_ms=args.stub_load_ms,
+            prefill_ms_per_token=args.stub_prefill_ms_per_token,
+            token_rate=args.stub_token_rate,
+            response_tokens=args.stub_response_tokens,
+            embed_ms_per_text=args.stub_embed_ms,
+            embedding_dim=args.stub_embedding_dim
+        ))
+        host = stub.start()
+
+    report = OrderedDict()
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+    report["config"]["ollama_host"] = host if stub is None else "stub"
+    report["environment"] = {"python": sys.version.split()[0], "platform": platform.platform(),
+                             "cpu_count": os.cpu_count()}
+    try:
+        with tempfile.TemporaryDirectory(prefix="assistant_bench_") as workdir:
+            embeddings = OllamaEmbeddings(model=args.embedding_model, base_url=host)
+            if not args.no_embedding_cache:
+                embeddings = CachedEmbeddings(embeddings, EmbeddingCacheStore(
+                    os.path.join(workdir, "embedding_cache"), args.embedding_model))
+            vectorstore = Chroma(embedding_function=embeddings, persist_directory=os.path.join(workdir, "chroma"))
+            settings = IngestionSettings(parse_workers=args.parse_workers, embed_concurrency=args.embed_concurrency,
+                                         embed_batch_size=args.embed_batch_size)
+            manifest = IngestionManifest(os.path.join(workdir, "manifest.json"))
+            keyword_index = KeywordIndex(os.path.join(workdir, "chroma", "keyword_index.sqlite3"))
+            sessions = load_prompt_sessions(args.prompts)
+            prompts = [p for session in sessions.values() for p in session["prompts"]]
+
+            files = synthetic_corpus(args.docs, args.paragraphs, seed=args.seed)
+            if args.suite in ("all", "startup"):
+                report["startup"] = bench_startup(host, workdir, files, args.startup_runs)
+            if args.suite == "startup":
+                return report
+
+            # Every other suite needs a populated knowledge base; only "ingest" and "all" report its timing
+            ingestion_report = bench_ingestion(files, vectorstore, embeddings, settings, manifest, keyword_index)
+            if args.suite in ("all", "ingest"):
+                report["ingestion"] = ingestion_report
+            if args.suite in ("all", "retrieval"):
+                report["retrieval"] = bench_retrieval(vectorstore, prompts, args.top_k, args.token_budget,
+                                                      repeats=args.retrieval_repeats, keyword_index=keyword_index)
+            if args.suite in ("all", "chunking"):
+                report["chunking"] = bench_chunking(embeddings, settings, workdir, args.docs, args.paragraphs,
+                                                    range(args.seed, args.seed + args.chunking_seeds))
+            if args.suite in ("all", "vectors"):
+                report["vector_store"] = bench_vector_store(vectorstore, embeddings, files, settings, workdir, prompts,
+                                                            args.vector_k, args.rerank_factor, args.probe_lists,
+                                                            seed=args.seed)
+            if args.suite in ("all", "chat"):
+                client = ollama.Client(host=host)
+                report["chat"] = bench_chat(sessions, client, args.model, vectorstore, args, keyword_index)
+    finally:
+        if stub is not None:
+            report["stub_requests"] = dict(stub.request_counts)
+            stub.stop()
+    return report
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = run(args)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["regressions"] = compare_to_baseline(report, baseline, args.tolerance)
+        exit_code = 1 if report["regressions"] else 0
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import time
+
+import ollama
+
+from metrics import ollama_timings
+from retrieval import (DEFAULT_CONTEXT_TOKEN_BUDGET, DEFAULT_RETRIEVAL_MODE, DEFAULT_TOP_K, build_chat_messages,
+                       retrieve_context)
+
+# --- Chat turn logic shared by the Streamlit app and the benchmark harness ---
+# `client` defaults to the ollama module (the daemon from OLLAMA_HOST); the benchmark
+# passes an ollama.Client pointed at its stub server instead.
+
+
+def stream_chat_turn(model, system_instruction, history, prompt, temperature, vectorstore=None,
+                     summary="", top_k=DEFAULT_TOP_K, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET,
+                     context_template="{context}", summary_template="{summary}",
+                     on_retrieval_error=None, client=None, turn_stats=None, keep_alive=None,
+                     keyword_index=None, retrieval_mode=DEFAULT_RETRIEVAL_MODE):
+    """Retrieve context for `prompt`, call the chat model and yield response text pieces.
+
+    `history` must already end with the user's `prompt`. A failed knowledge base
+    search is reported through `on_retrieval_error` and the turn continues without it.
+    If `turn_stats` is a dict it is filled with wall-clock timings (retrieval, time to
+    first token, total) and the load/prefill/decode timings Ollama reports at the end.
+    """
+    client = client or ollama
+    stats = turn_stats if turn_stats is not None else {}
+    started = time.perf_counter()
+
+    # Retrieve relevant knowledge base chunks, bounded by a fixed token budget
+    context_documents = []
+    if vectorstore is not None:
+        try:
+            context_documents = retrieve_context(vectorstore, prompt, top_k=top_k, token_budget=token_budget,
+                                                 keyword_index=keyword_index, mode=retrieval_mode)
+        except Exception as e:
+            if on_retrieval_error is None:
+                raise
+            on_retrieval_error(e)
+    stats["retrieval_ms"] = (time.perf_counter() - started) * 1000
+    stats["context_chunks"] = len(context_documents)
+    stats["retrieval_mode"] = retrieval_mode if keyword_index is not None else "vector"
+
+    stream = client.chat(
+        model=model,
+        messages=build_chat_messages(
+            system_instruction,
+            history,
+            context_documents,
+            context_template=context_template,
+            summary=summary,
+            summary_template=summary_template
+        ),
+        stream=True, # Enable streaming responses
+        options=dict(temperature=temperature), # Apply temperature setting
+        keep_alive=keep_alive # None keeps Ollama's default
+    )
+    for chunk in stream:
+        content = chunk['message'].get('content') if chunk.get('message') else None
+        if content:
+            if "ttft_ms" not in stats:
+                stats["ttft_ms"] = (time.perf_counter() - started) * 1000
+            yield content
+        if chunk.get('done'):
+            stats.update(ollama_timings(chunk))
+    stats["total_ms"] = (time.perf_counter() - started) * 1000
+
+
+def summarize_conversation(model, request_template, previous_summary, messages, max_tokens, client=None,
+                           keep_alive=None):
+    # Ask the chat model to fold older turns into the running summary
+    client = client or ollama
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    response = client.chat(
+        model=model,
+        messages=[{
+            "role": "user",
+            "content": request_template.format(
+                summary=previous_summary or "-",
+                transcript=transcript,
+                max_words=max_tokens * 3 // 4
+            )
+        }],
+        options=dict(temperature=0.0, num_predict=max_tokens),
+        keep_alive=keep_alive
+    )
+    return response["message"]["content"]
@@ -0,0 +1,230 @@
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field
+
+from retrieval import estimate_tokens
+
+# --- Structure-aware chunking ---
+# Documents are cut along their own structure rather than every N characters: Markdown
+# headings (and numbered or all-caps heading lines in PDFs) start a new section, small
+# neighbouring sections are packed together up to a token budget, and only a section
+# that is too long is split, on paragraphs, then lines, then sentences, then words.
+# The pieces of a cut section start with its heading path. Overlap is added only where a
+# section has to be cut, and per document type: Markdown boundaries are clean, PDF text
+# extraction is not.
+
+STRATEGY_STRUCTURED = "structured"
+STRATEGY_RECURSIVE = "recursive" # Fixed-size character windows (the previous splitter), for comparison
+
+DOCUMENT_MARKDOWN = "markdown"
+DOCUMENT_PDF = "pdf"
+DOCUMENT_TEXT = "text"
+
+DEFAULT_CHUNK_TOKENS = 256
+# Overlap in tokens, carried over as whole sentences or lines where a section is cut
+DEFAULT_OVERLAP_TOKENS = {DOCUMENT_MARKDOWN: 0, DOCUMENT_TEXT: 16, DOCUMENT_PDF: 32}
+
+_MARKDOWN_HEADING = re.compile(r"^ {0,3}(#{1,6})\s+(.+?)\s*#*\s*$")
+_NUMBERED_HEADING = re.compile(r"^(\d{1,2}(?:\.\d{1,2})*)\.?\s+\S")
+_FENCE = re.compile(r"^ {0,3}(```|~~~)")
+# Coarsest first; every separator stays attached to the piece before it
+_SEPARATORS = (
+    re.compile(r"\n[ \t]*\n\s*"),
+    re.compile(r"\n"),
+    re.compile(r"(?<=[.!?])\s+|(?<=[。！？；])"),
+    re.compile(r"\s+")
+)
+
+
+@dataclass
+class ChunkingProfile:
+    chunk_tokens: int = DEFAULT_CHUNK_TOKENS
+    overlap_tokens: dict = field(default_factory=lambda: dict(DEFAULT_OVERLAP_TOKENS))
+    strategy: str = STRATEGY_STRUCTURED
+
+    def overlap_for(self, document_type):
+        return self.overlap_tokens.get(document_type, 0)
+
+    def fingerprint(self):
+        # Stable text form; files chunked under different settings are not interchangeable
+        return json.dumps(asdict(self), sort_keys=True)
+
+
+def document_type(file_name):
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == ".md":
+        return DOCUMENT_MARKDOWN
+    if extension == ".pdf":
+        return DOCUMENT_PDF
+    return DOCUMENT_TEXT
+
+
+def _heading(line, doc_type):
+    # (level, title) if the line starts a section
+    match = _MARKDOWN_HEADING.match(line)
+    if match and doc_type != DOCUMENT_PDF:
+        return len(match.group(1)), match.group(2)
+    if doc_type == DOCUMENT_PDF:
+        # Extracted PDF text has no markup: take short numbered or all-caps lines without closing punctuation
+        stripped = line.strip()
+        if not stripped or len(stripped) > 80 or stripped[-1] in ".,;:!?。，；：！？":
+            return None
+        match = _NUMBERED_HEADING.match(stripped)
+        if match:
+            return match.group(1).count(".") + 1, stripped
+        if stripped.isupper() and len(stripped.split()) <= 8 and sum(c.isalpha() for c in stripped) >= 3:
+            return 1, stripped
+    return None
+
+
+def _sections(text, doc_type, path):
+    # Yield (heading path, section text); `path` is a list of (level, title), updated in place
+    # so the heading path carries over page breaks
+    lines = []
+    in_fence = False
+    for line in text.splitlines():
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        heading = None if in_fence else _heading(line, doc_type)
+        if heading is not None:
+            if any(l.strip() for l in lines):
+                yield " > ".join(title for _, title in path), "\n".join(lines)
+            lines = []
+            level, title = heading
+            path[:] = [(l, t) for l, t in path if l < level] + [(level, title)]
+        lines.append(line)
+    if any(l.strip() for l in lines):
+        yield " > ".join(title for _, title in path), "\n".join(lines)
+
+
+def _cut(text, pattern):
+    pieces = []
+    start = 0
+    for match in pattern.finditer(text):
+        if match.start() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    pieces.append(text[start:])
+    return [piece for piece in pieces if piece.strip()]
+
+
+def _pieces(text, limit, level=0):
+    # Split on the coarsest separator that brings every piece under `limit` tokens
+    if estimate_tokens(text) <= limit:
+        return [text]
+    while level < len(_SEPARATORS):
+        parts = _cut(text, _SEPARATORS[level])
+        level += 1
+        if len(parts) > 1:
+            return [piece for part in parts for piece in _pieces(part, limit, level)]
+    # One unbroken run (e.g. CJK without punctuation); a token is at least one character
+    return [text[i:i + limit] for i in range(0, len(text), limit)]
+
+
+def _prefix(section, limit):
+    # Heading path that starts each continuation piece, counted against the chunk budget and
+    # kept to a quarter of it: outer headings are dropped first, then the last one is cut
+    if not section:
+        return ""
+    allowed = max(limit // 4, 1)
+    titles = section.split(" > ")
+    while len(titles) > 1 and estimate_tokens(" > ".join(titles) + "\n") > allowed:
+        titles.pop(0)
+    text = " > ".join(titles)
+    cut = len(text)
+    while cut and estimate_tokens(text[:cut] + "\n") > allowed:
+        cut -= 1
+    return f"{text[:cut]}\n" if cut else ""
+
+
+def _windows(pieces, limit, overlap):
+    # Pack pieces into windows of at most `limit` tokens; each window after the first
+    # starts with trailing pieces of the previous one, up to `overlap` tokens
+    window, used = [], 0
+    for piece in pieces:
+        cost = estimate_tokens(piece)
+        if window and used + cost > limit:
+            yield "".join(window).strip()
+            carried, carried_cost = [], 0
+            for previous in reversed(window):
+                previous_cost = estimate_tokens(previous)
+                if carried_cost + previous_cost > overlap or carried_cost + previous_cost + cost > limit:
+                    break
+                carried.insert(0, previous)
+                carried_cost += previous_cost
+            window, used = carried, carried_cost
+        window.append(piece)
+        used += cost
+    if window:
+        yield "".join(window).strip()
+
+
+def _recursive_chunks(pages, profile, doc_type):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    # ~4 characters per token, so 250/50 tokens is the old 1000/200-character splitter
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=profile.chunk_tokens * 4,
+                                                   chunk_overlap=profile.overlap_for(doc_type) * 4)
+    for text, metadata in pages:
+        for chunk in text_splitter.split_text(text):
+            if chunk.strip():
+                yield chunk, dict(metadata)
+
+
+def split_pages(file_name, pages, profile=None):
+    """Yield (text, metadata) chunks for the (text, metadata) pages of one document.
+
+    Small sections are packed together across page breaks, so a section cut by a page
+    break is not split into two short chunks; a chunk keeps the metadata of the page it
+    starts on. The pieces of a section that had to be cut repeat its heading path as
+    their first line, within the chunk budget.
+    """
+    profile = profile or ChunkingProfile()
+    doc_type = document_type(file_name)
+    if profile.strategy == STRATEGY_RECURSIVE:
+        yield from _recursive_chunks(pages, profile, doc_type)
+        return
+
+    limit = profile.chunk_tokens
+    overlap = profile.overlap_for(doc_type)
+    path = []
+    # At most one chunk's worth of text is carried from page to page
+    packed, packed_tokens, packed_metadata = [], 0, None
+    for text, metadata in pages:
+        for section, body in _sections(text, doc_type, path):
+            body = body.strip()
+            cost = estimate_tokens(body)
+            start_metadata = metadata
+            if cost > limit:
+                prefix = _prefix(section, limit)
+                budget = limit - estimate_tokens(prefix)
+                # Text packed so far leads the first window rather than becoming a short
+                # chunk of its own (e.g. a document title right before a long section)
+                lead, lead_metadata = [], metadata
+                if packed and packed_tokens + 1 <= budget:
+                    lead, lead_metadata = ["\n\n".join(packed) + "\n\n"], packed_metadata
+                elif packed:
+                    yield "\n\n".join(packed), dict(packed_metadata)
+                packed, packed_tokens = [], 0
+                windows = list(_windows(lead + _pieces(body, budget), budget, overlap))
+                for i, window in enumerate(windows[:-1]):
+                    yield window if i == 0 else prefix + window, dict(lead_metadata if i == 0 else metadata)
+                # The last piece is usually short: later sections are packed after it
+                if len(windows) == 1:
+                    body, start_metadata = windows[0], lead_metadata
+                else:
+                    body = prefix + windows[-1]
+                cost = estimate_tokens(body)
+            # Joining with a blank line can round the estimate up by one token
+            elif packed and packed_tokens + 1 + cost > limit:
+                yield "\n\n".join(packed), dict(packed_metadata)
+                packed, packed_tokens = [], 0
+            if packed:
+                cost += 1
+            else:
+                packed_metadata = start_metadata
+            packed.append(body)
+            packed_tokens += cost
+    if packed:
+        yield "\n\n".join(packed), dict(packed_metadata)
@@ -0,0 +1,126 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- Persistent conversation history ---
+# Every message is appended to a small SQLite file as soon as it is shown, so a browser
+# refresh or an app restart picks the conversation up again. Saving a message is a single
+# insert whatever the length of the conversation, and the rolling summary is kept with
+# the conversation, so a reopened conversation does not need to be summarized again.
+# Each conversation belongs to an owner token (a secret kept by the user's session), and
+# every read, write and delete is limited to the caller's own conversations.
+
+TITLE_MAX_CHARS = 60
+
+
+class ConversationStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def _db(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id TEXT PRIMARY KEY, title TEXT, created_at REAL, updated_at REAL,
+                    summary TEXT NOT NULL DEFAULT '', summarized_count INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS conversations_by_owner ON conversations (owner, updated_at);
+                CREATE TABLE IF NOT EXISTS messages (
+                    conversation_id TEXT, position INTEGER, role TEXT, content TEXT, extra TEXT,
+                    PRIMARY KEY (conversation_id, position)
+                ) WITHOUT ROWID;
+            """)
+        return self._connection
+
+    def _owns(self, conversation_id, owner):
+        # True for the owner's conversations and IDs not saved yet
+        row = self._db.execute("SELECT owner FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is None or row[0] == owner
+
+    def owns(self, conversation_id, owner):
+        with self._lock:
+            return self._owns(conversation_id, owner)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def append(self, conversation_id, owner, message):
+        """Save `message` (a chat message dict) after the last message of the conversation.
+
+        The conversation is created with its first message, owned by `owner` and titled after
+        the first user message. Raises PermissionError for another owner's conversation.
+        """
+        now = time.time()
+        extra = {key: value for key, value in message.items() if key not in ("role", "content")}
+        with self._lock, self._db:
+            if not self._owns(conversation_id, owner):
+                raise PermissionError(f"conversation {conversation_id} belongs to another owner")
+            self._db.execute(
+                "INSERT OR IGNORE INTO conversations (id, title, created_at, updated_at, owner) "
+                "VALUES (?, NULL, ?, ?, ?)",
+                (conversation_id, now, now, owner)
+            )
+            self._db.execute(
+                "UPDATE conversations SET updated_at = ?, title = COALESCE(title, ?) WHERE id = ?",
+                (now, " ".join(message["content"].split())[:TITLE_MAX_CHARS] if message["role"] == "user" else None,
+                 conversation_id)
+            )
+            self._db.execute(
+                "INSERT INTO messages (conversation_id, position, role, content, extra) "
+                "SELECT ?, COALESCE(MAX(position) + 1, 0), ?, ?, ? FROM messages WHERE conversation_id = ?",
+                (conversation_id, message["role"], message["content"], json.dumps(extra, ensure_ascii=False),
+                 conversation_id)
+            )
+
+    def messages(self, conversation_id, owner):
+        with self._lock:
+            if not self._owns(conversation_id, owner):
+                return []
+            rows = self._db.execute(
+                "SELECT role, content, extra FROM messages WHERE conversation_id = ? ORDER BY position",
+                (conversation_id,)
+            ).fetchall()
+        return [{"role": role, "content": content, **json.loads(extra or "{}")} for role, content, extra in rows]
+
+    def conversations(self, owner, limit=20):
+        # (id, title, updated_at) of the owner's most recently used conversations, newest first
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, COALESCE(title, ''), updated_at FROM conversations WHERE owner = ? "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (owner, limit)
+            ).fetchall()
+
+    def memory_state(self, conversation_id, owner):
+        # (summary, summarized_count) saved for ConversationMemory; empty for a new conversation
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary, summarized_count FROM conversations WHERE id = ? AND owner = ?",
+                (conversation_id, owner)
+            ).fetchone()
+        return row if row is not None else ("", 0)
+
+    def save_memory_state(self, conversation_id, owner, summary, summarized_count):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE conversations SET summary = ?, summarized_count = ? WHERE id = ? AND owner = ?",
+                (summary, summarized_count, conversation_id, owner)
+            )
+
+    def delete(self, conversation_id, owner):
+        with self._lock, self._db:
+            if not self._owns(conversation_id, owner):
+                raise PermissionError(f"conversation {conversation_id} belongs to another owner")
+            self._db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self._db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
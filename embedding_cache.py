@@ -0,0 +1,175 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- Persistent embedding cache ---
+# Vectors live in a memory-mapped float32 matrix (one row per cached chunk) and a small
+# SQLite index maps sha256(model, text) to a row and its last-use time. When the cache is
+# full the least recently used rows are reused. The cache sits outside the ChromaDB folder,
+# so clearing the knowledge base and re-uploading the same documents costs no embedding calls.
+
+DEFAULT_MAX_ENTRIES = 200_000
+_INITIAL_ROWS = 1024
+
+
+def _cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _as_list(vector):
+    return vector.tolist() if isinstance(vector, np.ndarray) else list(vector)
+
+
+class EmbeddingCacheStore:
+    def __init__(self, cache_dir, model_name, max_entries=DEFAULT_MAX_ENTRIES):
+        # One sub-folder per model, since vectors from different models are not interchangeable
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.directory = os.path.join(cache_dir, safe_name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._matrix_path = os.path.join(self.directory, "vectors.f32")
+        self._db = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self._db.commit()
+        meta = dict(self._db.execute("SELECT name, value FROM meta"))
+        self.dim = meta.get("dim")
+        self._rows = meta.get("rows", 0)
+        self._next_row = meta.get("next_row", 0) # Rows below this have been written at least once
+        self._matrix = None
+        if self.dim and os.path.exists(self._matrix_path):
+            self._open_matrix()
+
+    def _open_matrix(self):
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(self._rows, self.dim))
+
+    def _set_meta(self, name, value):
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def _grow(self, needed_rows):
+        # Grow the file geometrically instead of pre-allocating max_entries rows up front
+        new_rows = min(self.max_entries, max(_INITIAL_ROWS, self._rows * 2, needed_rows))
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._matrix_path, "ab") as f:
+            f.truncate(new_rows * self.dim * 4)
+        self._rows = new_rows
+        self._set_meta("rows", new_rows)
+        self._open_matrix()
+
+    def get_many(self, keys):
+        # Returns {key: vector} for cached keys and refreshes their LRU timestamps
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            if self._matrix is None: # _grow swaps the matrix under the lock
+                return found
+            for i in range(0, len(keys), 500): # Stay under SQLite's bound-parameter limit
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                for key, row in self._db.execute(
+                        f"SELECT key, row FROM entries WHERE key IN ({placeholders})", part):
+                    found[key] = np.array(self._matrix[row])
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                     [(now, key) for key in found])
+                self._db.commit()
+        return found
+
+    def put_many(self, items):
+        # items: list of (key, vector); evicts least recently used rows when full
+        if not items:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = len(items[0][1])
+                self._set_meta("dim", self.dim)
+            # Another thread may have stored the same chunk meanwhile; keep its row
+            keys = [key for key, _ in items]
+            existing = set()
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                existing.update(key for (key,) in self._db.execute(
+                    f"SELECT key FROM entries WHERE key IN ({placeholders})", part))
+            items = [(key, vector) for key, vector in items
+                     if key not in existing and len(vector) == self.dim][:self.max_entries]
+            if not items:
+                return
+
+            # Append while there is room, then recycle the least recently used rows
+            next_row = self._next_row
+            free_rows = list(range(next_row, min(next_row + len(items), self.max_entries)))
+            self._next_row = next_row + len(free_rows)
+            self._set_meta("next_row", self._next_row)
+            if free_rows and free_rows[-1] >= self._rows:
+                self._grow(free_rows[-1] + 1)
+            shortfall = len(items) - len(free_rows)
+            if shortfall > 0:
+                evicted = self._db.execute(
+                    "SELECT key, row FROM entries ORDER BY last_used LIMIT ?", (shortfall,)).fetchall()
+                self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                free_rows.extend(row for _, row in evicted)
+
+            now = time.time()
+            rows = []
+            for (key, vector), row in zip(items, free_rows):
+                self._matrix[row] = np.asarray(vector, dtype=np.float32)
+                rows.append((key, row, now))
+            self._matrix.flush()
+            self._db.executemany("INSERT INTO entries (key, row, last_used) VALUES (?, ?, ?)", rows)
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the wrapped model."""
+
+    def __init__(self, embeddings, store):
+        self.embeddings = embeddings
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        keys = [_cache_key(self.store.model_name, text) for text in texts]
+        cached = self.store.get_many(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.store.put_many(new_items)
+            cached.update((key, vector) for key, vector in new_items)
+        return [_as_list(cached[key]) for key in keys]
+
+    def embed_query(self, text):
+        key = _cache_key(self.store.model_name, "query\0" + text)
+        cached = self.store.get_many([key])
+        if key in cached:
+            self.hits += 1
+            return _as_list(cached[key])
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self.store.put_many([(key, vector)])
+        return vector
@@ -0,0 +1,466 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+from chunking import ChunkingProfile, split_pages
+from manifest import chunk_id_sequence
+
+# --- Pipelined document ingestion ---
+# Files are parsed and split in a process pool, chunks flow through a bounded queue,
+# embedding requests run concurrently up to a fixed in-flight limit, and finished
+# vectors are written to the vector store in large upserts. The queue applies back-pressure,
+# so memory stays proportional to the pipeline depth rather than the corpus size.
+# With a manifest, unchanged files are skipped and only changed chunks are embedded.
+# Uploads are read straight from their bytes, page by page; when parsing in a thread,
+# each page's chunks are queued for embedding before the next page is read. Large files
+# always take that path: a worker process returns all of a file's chunks at once.
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+DEFAULT_PARSE_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_EMBED_BATCH_SIZE = 32
+DEFAULT_EMBED_CONCURRENCY = 4
+DEFAULT_UPSERT_BATCH_SIZE = 512
+DEFAULT_QUEUE_SIZE = 16 # Embedding batches buffered between the parsers and the embedder
+# Starting worker processes costs a few seconds, so small uploads are parsed in a thread
+DEFAULT_PROCESS_POOL_MIN_BYTES = 8 * 1024 * 1024
+# Files above this size are streamed in the thread even when a process pool is used
+DEFAULT_PROCESS_POOL_MAX_FILE_BYTES = 2 * 1024 * 1024
+
+_QUEUE_POLL_SECONDS = 0.05
+
+
+@dataclass
+class IngestionSettings:
+    chunking: ChunkingProfile = field(default_factory=ChunkingProfile)
+    parse_workers: int = DEFAULT_PARSE_WORKERS # 0 or 1 parses in a background thread instead of processes
+    embed_batch_size: int = DEFAULT_EMBED_BATCH_SIZE
+    embed_concurrency: int = DEFAULT_EMBED_CONCURRENCY
+    upsert_batch_size: int = DEFAULT_UPSERT_BATCH_SIZE
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    process_pool_min_bytes: int = DEFAULT_PROCESS_POOL_MIN_BYTES
+    process_pool_max_file_bytes: int = DEFAULT_PROCESS_POOL_MAX_FILE_BYTES
+
+
+@dataclass
+class IngestionResult:
+    files_total: int = 0
+    files_done: int = 0
+    chunks_parsed: int = 0
+    chunks_embedded: int = 0
+    chunks_written: int = 0
+    chunks_unchanged: int = 0
+    chunks_removed: int = 0
+    # (file_name, stored_as) for uploads whose exact content is already in the knowledge base
+    files_skipped: list = field(default_factory=list)
+    # (kind, file_name, detail) with kind in "unsupported", "empty", "failed", "duplicate"
+    file_issues: list = field(default_factory=list)
+    error: Exception = None
+    cancelled: bool = False
+
+
+def iter_pages(file_name, data):
+    """Yield (text, metadata) for each page of an upload, read from its bytes in memory.
+
+    PDF pages are extracted one at a time as the caller asks for them (same text and
+    metadata as PyPDFLoader); a text file is a single page.
+    """
+    if os.path.splitext(file_name)[1].lower() == ".pdf":
+        from pypdf import PdfReader
+
+        reader = PdfReader(io.BytesIO(data)) # Shares the upload's buffer, no copy or temp file
+        total_pages = len(reader.pages)
+        for page_number, page in enumerate(reader.pages):
+            text = (page.extract_text(extraction_mode="plain") or "").strip()
+            yield text, {"source": file_name, "total_pages": total_pages, "page": page_number,
+                         "page_label": reader.page_labels[page_number]}
+    else:
+        yield data.decode("utf-8"), {"source": file_name}
+
+
+def iter_chunks(file_name, data, chunking):
+    # Split each page as soon as it is read, so only one page's text is held at a time
+    return split_pages(file_name, iter_pages(file_name, data), chunking)
+
+
+def file_key(data, chunking):
+    # Content hash salted with the chunking settings: a file uploaded again under another
+    # profile is split again instead of being skipped as already stored
+    digest = hashlib.sha256(chunking.fingerprint().encode("utf-8"))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def load_and_split(file_name, data, chunking):
+    # Runs inside a worker process, so keep heavy imports local and return plain data
+    started = time.perf_counter()
+    file_extension = os.path.splitext(file_name)[1].lower()
+    if file_extension not in SUPPORTED_EXTENSIONS:
+        return {"file_name": file_name, "status": "unsupported", "detail": file_extension, "chunks": []}
+    try:
+        chunks = list(iter_chunks(file_name, data, chunking))
+    except Exception as e:
+        return {"file_name": file_name, "status": "failed", "detail": str(e), "chunks": []}
+    if not chunks:
+        return {"file_name": file_name, "status": "empty", "detail": "", "chunks": []}
+    return {"file_name": file_name, "status": "ok", "detail": "", "chunks": chunks,
+            "parse_ms": (time.perf_counter() - started) * 1000}
+
+
+def _put(chunk_queue, item, stop_event):
+    # Blocking put that gives up once the consumer has stopped
+    while not stop_event.is_set():
+        try:
+            chunk_queue.put(item, timeout=_QUEUE_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(files, settings, manifest, chunk_queue, stop_event, recorder=None):
+    # Parse files (bounded number in flight) and stream their chunks into the queue
+    executor = None
+    try:
+        # Skip content that is already stored, or repeated within this upload. Only the
+        # position and size of each file are kept, so a lazy `files` sequence is read one
+        # file at a time here and again when that file is parsed
+        to_parse = []
+        seen_hashes = {}
+        seen_names = set()
+        for index, (name, data) in enumerate(files):
+            if name in seen_names:
+                # The manifest is keyed by file name, so a second file of the same name
+                # would leave the first one's chunks behind where no later run sees them
+                if not _emit_issue("duplicate", name, "", chunk_queue, stop_event):
+                    return
+                continue
+            seen_names.add(name)
+            file_hash = file_key(data, settings.chunking)
+            stored_as = seen_hashes.get(file_hash) or (manifest.find_by_hash(file_hash) if manifest else None)
+            if stored_as is not None:
+                if not _put(chunk_queue, ("skipped", (name, stored_as)), stop_event):
+                    return
+                continue
+            seen_hashes[file_hash] = name
+            to_parse.append((index, len(data), file_hash))
+
+        # Small files go to the process pool (when it is worth starting), so at most `window`
+        # files' chunks are held at once; everything else is streamed page by page
+        pooled, streamed = [], []
+        for item in to_parse:
+            (pooled if item[1] <= settings.process_pool_max_file_bytes else streamed).append(item)
+        if settings.parse_workers <= 1 or sum(size for _, size, _ in pooled) < settings.process_pool_min_bytes:
+            pooled, streamed = [], to_parse
+
+        if pooled:
+            executor = ProcessPoolExecutor(
+                max_workers=settings.parse_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            window = settings.parse_workers * 2
+            pending = {}
+            remaining = iter(pooled)
+            while True:
+                for index, _, file_hash in remaining:
+                    name, data = files[index]
+                    future = executor.submit(load_and_split, name, data, settings.chunking)
+                    pending[future] = file_hash
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_hash = pending.pop(future)
+                    result = future.result()
+                    if result["status"] != "ok":
+                        _record_parse(recorder, result["file_name"], result["status"], None, 0)
+                        if not _emit_issue(result["status"], result["file_name"], result["detail"], chunk_queue,
+                                           stop_event):
+                            return
+                        continue
+                    _record_parse(recorder, result["file_name"], "ok", result["parse_ms"], len(result["chunks"]))
+                    if not _emit(result["file_name"], file_hash, result["chunks"], settings, manifest,
+                                 chunk_queue, stop_event):
+                        return
+            executor.shutdown(wait=False)
+            executor = None
+
+        for index, _, file_hash in streamed:
+            # Streamed: chunks reach the embedder while later pages are still being parsed
+            name, data = files[index]
+            file_extension = os.path.splitext(name)[1].lower()
+            if file_extension not in SUPPORTED_EXTENSIONS:
+                _record_parse(recorder, name, "unsupported", None, 0)
+                if not _emit_issue("unsupported", name, file_extension, chunk_queue, stop_event):
+                    return
+                continue
+            chunks = iter_chunks(name, data, settings.chunking)
+            if not _emit(name, file_hash, chunks, settings, manifest, chunk_queue, stop_event, recorder):
+                return
+    except Exception as e:
+        _put(chunk_queue, ("error", e), stop_event)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        _put(chunk_queue, ("end", None), stop_event)
+
+
+def _record_parse(recorder, file_name, status, duration_ms, chunks):
+    if recorder is not None:
+        recorder.record("parse_file", file_name=file_name, status=status, duration_ms=duration_ms, chunks=chunks)
+
+
+def _span(recorder, kind, **fields):
+    # Wall-clock span of one pipeline stage, or nothing without a recorder
+    return recorder.span(kind, **fields) if recorder is not None else nullcontext(fields)
+
+
+def _embed_batch(embeddings, texts, recorder):
+    with _span(recorder, "embed_batch", size=len(texts)):
+        return embeddings.embed_documents(texts)
+
+
+def _emit_issue(kind, file_name, detail, chunk_queue, stop_event):
+    if not _put(chunk_queue, ("issue", (kind, file_name, detail)), stop_event):
+        return False
+    return _put(chunk_queue, ("file_done", None), stop_event)
+
+
+def _emit(file_name, file_hash, chunks, settings, manifest, chunk_queue, stop_event, recorder=None):
+    """Queue the new chunks of one file in embedding batches, then its commit record.
+
+    `chunks` may be a lazy iterator of (text, metadata); its parsing time is recorded
+    when `recorder` is given. Returns False once the consumer has stopped.
+    """
+    # Diff against the previous version of this file: only new chunk IDs need embedding
+    previous = manifest.get(file_name) if manifest else None
+    previous_ids = set(previous["chunk_ids"]) if previous else set()
+    next_id = chunk_id_sequence(file_name)
+    ids = []
+    batch = []
+    new_count = 0
+    status, detail = "ok", ""
+    started = time.perf_counter()
+    waited = 0.0 # Time blocked on the queue, which is not parsing time
+    try:
+        for text, metadata in chunks:
+            chunk_id = next_id(text)
+            ids.append(chunk_id)
+            if chunk_id in previous_ids:
+                continue
+            batch.append((chunk_id, text, metadata))
+            new_count += 1
+            if len(batch) >= settings.embed_batch_size:
+                put_started = time.perf_counter()
+                if not _put(chunk_queue, ("chunks", (file_name, batch)), stop_event):
+                    return False
+                waited += time.perf_counter() - put_started
+                batch = []
+    except Exception as e:
+        status, detail = "failed", str(e)
+    if not ids and status == "ok":
+        status = "empty"
+    if recorder is not None:
+        _record_parse(recorder, file_name, status, (time.perf_counter() - started - waited) * 1000, len(ids))
+
+    if batch and not _put(chunk_queue, ("chunks", (file_name, batch)), stop_event):
+        return False
+    if status != "ok" and not _put(chunk_queue, ("issue", (status, file_name, detail)), stop_event):
+        return False
+    if not ids:
+        return _put(chunk_queue, ("file_done", None), stop_event)
+    return _put(chunk_queue, ("file_done", {
+        "file_name": file_name,
+        # A file that failed part-way is recorded without its hash: the chunks stored so far
+        # are tracked and replaced by the next upload, which is never skipped as a duplicate
+        "sha256": file_hash if status == "ok" else None,
+        "chunk_ids": ids,
+        "stale_ids": sorted(previous_ids - set(ids)),
+        "unchanged": len(ids) - new_count
+    }), stop_event)
+
+
+def upsert_vectors(vectorstore, ids, texts, metadatas, vectors):
+    # Write precomputed vectors straight to the underlying collection; going through
+    # Chroma.add_texts would embed every chunk a second time
+    if hasattr(vectorstore, "upsert_vectors"): # quantized_store.QuantizedVectorStore
+        vectorstore.upsert_vectors(ids, texts, metadatas, vectors)
+    else:
+        vectorstore._collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+
+
+def stored_ids(vectorstore, ids):
+    # Which of `ids` are already in the collection (used when resuming an interrupted run)
+    if hasattr(vectorstore, "stored_ids"):
+        return vectorstore.stored_ids(ids)
+    return set(vectorstore._collection.get(ids=list(ids), include=[])["ids"])
+
+
+def ingest_files(files, vectorstore, embeddings, settings=None, manifest=None, on_progress=None, recorder=None,
+                 cancel_event=None, skip_stored=False, keyword_index=None):
+    """Parse, embed and store `files`, a sequence of (file_name, bytes) pairs.
+
+    Each file is fetched by position when it is hashed and again when it is parsed,
+    so `files` may read its contents lazily (see ingestion_jobs.SpooledFiles).
+
+    `on_progress(result)` is called from the calling thread whenever something
+    advances, so it is safe to update Streamlit elements from it. A file is
+    recorded in `manifest` only after all of its chunks have been written.
+    Stage timings go to `recorder` (a metrics.MetricsRecorder) when given.
+    Setting `cancel_event` stops the run after writing what is already embedded.
+    With `skip_stored`, chunks already in the collection are not embedded again,
+    so a resumed run continues from its last written batch. A `keyword_index`
+    (keyword_index.KeywordIndex) is kept in step with every write and delete.
+    """
+    settings = settings or IngestionSettings()
+    result = IngestionResult(files_total=len(files))
+    chunk_queue = queue.Queue(maxsize=settings.queue_size)
+    stop_event = threading.Event()
+    started = time.perf_counter()
+    producer = threading.Thread(target=_produce, args=(files, settings, manifest, chunk_queue, stop_event, recorder),
+                                daemon=True)
+    producer.start()
+
+    pending_upsert = []
+    in_flight = {}
+    producer_done = False
+    outstanding = defaultdict(int) # Chunks per file that are queued or embedded but not yet written
+    pending_commits = []
+
+    def flush():
+        if pending_upsert:
+            with _span(recorder, "upsert", size=len(pending_upsert)):
+                upsert_vectors(
+                    vectorstore,
+                    ids=[chunk_id for _, chunk_id, _, _, _ in pending_upsert],
+                    texts=[text for _, _, text, _, _ in pending_upsert],
+                    metadatas=[metadata for _, _, _, metadata, _ in pending_upsert],
+                    vectors=[vector for _, _, _, _, vector in pending_upsert]
+                )
+                if keyword_index is not None:
+                    keyword_index.add(
+                        [chunk_id for _, chunk_id, _, _, _ in pending_upsert],
+                        [text for _, _, text, _, _ in pending_upsert],
+                        [metadata for _, _, _, metadata, _ in pending_upsert]
+                    )
+            for file_name, _, _, _, _ in pending_upsert:
+                outstanding[file_name] -= 1
+            result.chunks_written += len(pending_upsert)
+            pending_upsert.clear()
+        commit_files()
+
+    def commit_files():
+        # Drop stale chunks and record files whose new chunks are all stored
+        committed = False
+        for commit in list(pending_commits):
+            if outstanding[commit["file_name"]] > 0:
+                continue
+            pending_commits.remove(commit)
+            if commit["stale_ids"]:
+                vectorstore.delete(ids=commit["stale_ids"])
+                if keyword_index is not None:
+                    keyword_index.delete(commit["stale_ids"])
+                result.chunks_removed += len(commit["stale_ids"])
+            if manifest is not None:
+                manifest.record(commit["file_name"], commit["sha256"], commit["chunk_ids"])
+                committed = True
+        if committed:
+            manifest.save()
+
+    with ThreadPoolExecutor(max_workers=settings.embed_concurrency) as embed_executor:
+        try:
+            while not producer_done or in_flight:
+                if cancel_event is not None and cancel_event.is_set():
+                    result.cancelled = True
+                    for future in in_flight:
+                        future.cancel()
+                    break
+                progressed = False
+
+                # Pull more work while below the in-flight limit
+                while not producer_done and len(in_flight) < settings.embed_concurrency:
+                    try:
+                        kind, payload = chunk_queue.get(timeout=_QUEUE_POLL_SECONDS)
+                    except queue.Empty:
+                        break
+                    progressed = True
+                    if kind == "chunks":
+                        file_name, batch = payload
+                        if skip_stored:
+                            already_stored = stored_ids(vectorstore, [chunk_id for chunk_id, _, _ in batch])
+                            if already_stored:
+                                batch = [chunk for chunk in batch if chunk[0] not in already_stored]
+                                result.chunks_unchanged += len(already_stored)
+                            if not batch:
+                                continue
+                        result.chunks_parsed += len(batch)
+                        outstanding[file_name] += len(batch)
+                        texts = [text for _, text, _ in batch]
+                        in_flight[embed_executor.submit(_embed_batch, embeddings, texts, recorder)] = (file_name, batch)
+                    elif kind == "issue":
+                        result.file_issues.append(payload)
+                    elif kind == "skipped":
+                        result.files_skipped.append(payload)
+                        result.files_done += 1
+                    elif kind == "file_done":
+                        result.files_done += 1
+                        if payload is not None:
+                            result.chunks_unchanged += payload["unchanged"]
+                            pending_commits.append(payload)
+                            commit_files()
+                    elif kind == "error":
+                        raise payload
+                    elif kind == "end":
+                        producer_done = True
+
+                # Collect finished embedding batches and write them in bulk
+                if in_flight:
+                    done, _ = wait(list(in_flight), timeout=_QUEUE_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file_name, batch = in_flight.pop(future)
+                        vectors = future.result() # Re-raises embedding errors
+                        pending_upsert.extend(
+                            (file_name, chunk_id, text, metadata, vector)
+                            for (chunk_id, text, metadata), vector in zip(batch, vectors)
+                        )
+                        result.chunks_embedded += len(batch)
+                        progressed = True
+                    if len(pending_upsert) >= settings.upsert_batch_size:
+                        flush()
+
+                if progressed and on_progress:
+                    on_progress(result)
+            flush()
+        except Exception as e:
+            # Keep what is already embedded, then stop like the serial loop did on a failed batch
+            result.error = e
+            stop_event.set()
+            for future in in_flight:
+                future.cancel()
+            try:
+                flush()
+            except Exception:
+                pass
+        finally:
+            stop_event.set()
+
+    producer.join(timeout=5)
+    if recorder is not None:
+        seconds = time.perf_counter() - started
+        recorder.record("ingestion", files=result.files_total, chunks_written=result.chunks_written,
+                        chunks_unchanged=result.chunks_unchanged, duration_ms=seconds * 1000,
+                        chunks_per_sec=result.chunks_written / seconds if seconds else None,
+                        error=str(result.error) if result.error else None, cancelled=result.cancelled)
+    if on_progress:
+        on_progress(result)
+    return result
@@ -0,0 +1,264 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Sequence
+from dataclasses import asdict
+
+from ingestion import IngestionResult
+
+# --- Background ingestion jobs ---
+# Uploads are spooled to disk and processed one job at a time by a worker thread that
+# belongs to the process rather than to a browser session. The page stays responsive,
+# chatting continues while documents are indexed, and closing the tab does not abandon
+# the job. Files are committed to the manifest as soon as all of their chunks are
+# written, so a cancelled or interrupted job resumes from its last committed batch.
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+JOB_FILE = "job.json"
+PROGRESS_SAVE_INTERVAL_SECONDS = 1.0
+
+
+class SpooledFiles(Sequence):
+    """(file_name, bytes) pairs of a spooled job, each file read from disk only when it is indexed."""
+
+    def __init__(self, job):
+        self._job = job
+
+    def __len__(self):
+        return len(self._job.file_names)
+
+    def __getitem__(self, index):
+        name = self._job.file_names[index] # Raises IndexError past the end, which ends iteration
+        with open(self._job.file_path(index), "rb") as f:
+            return name, f.read()
+
+
+class IngestionJob:
+    def __init__(self, job_id, file_names, directory, status=STATUS_QUEUED, created_at=None, resume=False,
+                 profile=None):
+        self.job_id = job_id
+        self.file_names = list(file_names)
+        self.directory = directory
+        self.status = status
+        self.created_at = created_at or time.time()
+        self.finished_at = None
+        self.resume = resume # Skip chunks that an earlier attempt already stored
+        self.profile = profile # Chunking profile name, kept so a resumed job splits its files the same way
+        self.result = IngestionResult(files_total=len(self.file_names))
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in ACTIVE_STATUSES
+
+    def file_path(self, index):
+        # Spooled files are stored by position, so odd upload names never reach the file system
+        return os.path.join(self.directory, "files", f"{index:05d}")
+
+    def to_dict(self):
+        result = asdict(self.result)
+        result.pop("error")
+        return {
+            "job_id": self.job_id,
+            "file_names": self.file_names,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "resume": self.resume,
+            "profile": self.profile,
+            "error": self.error,
+            "result": result
+        }
+
+    @classmethod
+    def from_dict(cls, data, directory):
+        job = cls(data["job_id"], data["file_names"], directory, data["status"], data["created_at"], data["resume"],
+                  data.get("profile"))
+        job.finished_at = data.get("finished_at")
+        job.error = data.get("error")
+        for key, value in data.get("result", {}).items():
+            if hasattr(job.result, key):
+                setattr(job.result, key, [tuple(item) for item in value] if isinstance(value, list) else value)
+        return job
+
+
+class IngestionJobQueue:
+    """Process-wide FIFO of ingestion jobs with a single worker thread.
+
+    `run_fn(files, on_progress, cancel_event, skip_stored, profile)` does the actual
+    work (normally a call to ingestion.ingest_files) and returns an IngestionResult;
+    `profile` is whatever was passed to submit().
+    `on_finished(job)` is called from the worker after every job, including
+    cancelled and failed ones.
+    """
+
+    def __init__(self, spool_dir, run_fn, on_finished=None):
+        self.spool_dir = spool_dir
+        self._run_fn = run_fn
+        self._on_finished = on_finished
+        self._lock = threading.Condition()
+        self._jobs = {} # job_id -> IngestionJob, in submission order
+        self._pending = deque()
+        self._worker = None
+        os.makedirs(spool_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        # Pick up jobs from an earlier run; one that was running when the process stopped is resumed
+        jobs = []
+        for job_id in os.listdir(self.spool_dir):
+            directory = os.path.join(self.spool_dir, job_id)
+            try:
+                with open(os.path.join(directory, JOB_FILE), "r", encoding="utf-8") as f:
+                    jobs.append(IngestionJob.from_dict(json.load(f), directory))
+            except (OSError, ValueError, KeyError):
+                shutil.rmtree(directory, ignore_errors=True) # Spooled without a readable job file
+        for job in sorted(jobs, key=lambda job: job.created_at):
+            if job.active:
+                job.status = STATUS_QUEUED
+                job.resume = True
+                self._pending.append(job.job_id)
+            self._jobs[job.job_id] = job
+        if self._pending:
+            self._start_worker()
+
+    def _save(self, job):
+        tmp_path = os.path.join(job.directory, JOB_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(job.directory, JOB_FILE))
+
+    def _start_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._work, name="ingestion-worker", daemon=True)
+            self._worker.start()
+
+    def submit(self, files, profile=None):
+        """Spool `files` (a list of (file_name, bytes) pairs) to disk and queue them; returns the job ID."""
+        job_id = uuid.uuid4().hex[:8]
+        job = IngestionJob(job_id, [name for name, _ in files], os.path.join(self.spool_dir, job_id), profile=profile)
+        os.makedirs(os.path.join(job.directory, "files"))
+        for index, (_, data) in enumerate(files):
+            with open(job.file_path(index), "wb") as f:
+                f.write(data)
+        self._save(job) # Written last, so a half-spooled upload is never picked up as a job
+        with self._lock:
+            self._jobs[job_id] = job
+            self._pending.append(job_id)
+            self._start_worker()
+            self._lock.notify()
+        return job_id
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def has_active(self):
+        with self._lock:
+            return any(job.active for job in self._jobs.values())
+
+    def position(self, job_id):
+        # 1-based place in the waiting line, or None once the job has started
+        with self._lock:
+            try:
+                return list(self._pending).index(job_id) + 1
+            except ValueError:
+                return None
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.active:
+                return False
+            job.cancel_event.set()
+            if job.status == STATUS_QUEUED:
+                # Not started yet: it simply leaves the queue
+                self._pending.remove(job_id)
+                job.status = STATUS_CANCELLED
+                job.finished_at = time.time()
+                self._save(job)
+        return True
+
+    def resume(self, job_id):
+        # Re-queue a cancelled or failed job; already stored chunks are not embedded again
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in (STATUS_CANCELLED, STATUS_FAILED):
+                return False
+            job.status = STATUS_QUEUED
+            job.resume = True
+            job.error = None
+            job.finished_at = None
+            job.cancel_event = threading.Event()
+            self._save(job)
+            self._pending.append(job_id)
+            self._start_worker()
+            self._lock.notify()
+        return True
+
+    def remove(self, job_id):
+        # Forget a finished job and delete its spooled files
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.active:
+                return False
+            del self._jobs[job_id]
+        shutil.rmtree(job.directory, ignore_errors=True)
+        return True
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._lock.wait()
+                job = self._jobs[self._pending.popleft()]
+                job.status = STATUS_RUNNING
+            self._run(job)
+
+    def _run(self, job):
+        last_saved = 0.0
+
+        def on_progress(result):
+            nonlocal last_saved
+            job.result = result
+            if time.time() - last_saved >= PROGRESS_SAVE_INTERVAL_SECONDS:
+                last_saved = time.time()
+                self._save(job)
+
+        try:
+            job.result = self._run_fn(SpooledFiles(job), on_progress, job.cancel_event, job.resume, job.profile)
+            if job.result.error is not None:
+                job.status, job.error = STATUS_FAILED, str(job.result.error)
+            elif job.result.cancelled:
+                job.status = STATUS_CANCELLED
+            else:
+                job.status = STATUS_DONE
+        except Exception as e:
+            job.status, job.error = STATUS_FAILED, str(e)
+        job.finished_at = time.time()
+
+        if job.status == STATUS_DONE:
+            # Nothing left to resume; the job stays listed in memory until it is removed
+            shutil.rmtree(job.directory, ignore_errors=True)
+        else:
+            self._save(job)
+        if self._on_finished is not None:
+            try:
+                self._on_finished(job)
+            except Exception:
+                pass
@@ -0,0 +1,164 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+# --- Keyword (BM25) index over the knowledge base chunks ---
+# A small inverted index in SQLite, kept next to the Chroma files and updated by the
+# ingestion pipeline with the same chunk IDs. Exact terms such as pesticide or drug
+# names and disaster codes score well here even when their embeddings do not, and a
+# keyword search needs no call to the embedding model.
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+# Latin words and codes (keeping inner "-", "_" and "." like "2,4-d" or "h5n1"), and runs of CJK characters
+_TOKEN_PATTERN = re.compile(r"[0-9a-z]+(?:[-_.][0-9a-z]+)*|[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+")
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+
+
+def tokenize(text):
+    # CJK runs become overlapping character bigrams, since there are no spaces to split on;
+    # compound codes are indexed whole and by their parts, so "h5n1" and "n1" both match
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if _CJK_PATTERN.match(token):
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+            parts = re.split(r"[-_.]", token)
+            if len(parts) > 1:
+                tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class KeywordIndex:
+    def __init__(self, path, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._connection = None
+        self._stats = None # (document count, average length), recomputed after writes
+
+    @property
+    def _db(self):
+        # Connected lazily, so the index can be closed while its folder is deleted and recreated
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, length INTEGER, text TEXT, metadata TEXT);
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT, id TEXT, tf INTEGER, PRIMARY KEY (term, id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS postings_by_id ON postings (id);
+            """)
+            self._stats = None
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def add(self, ids, texts, metadatas=None):
+        # Upsert semantics, matching the Chroma collection: re-adding an ID replaces it
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock, self._db:
+            self._delete(ids)
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                counts = Counter(tokenize(text))
+                self._db.execute(
+                    "INSERT INTO docs (id, length, text, metadata) VALUES (?, ?, ?, ?)",
+                    (chunk_id, sum(counts.values()), text, json.dumps(metadata or {}, ensure_ascii=False))
+                )
+                self._db.executemany(
+                    "INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)",
+                    [(term, chunk_id, tf) for term, tf in counts.items()]
+                )
+            self._stats = None
+
+    def delete(self, ids):
+        with self._lock, self._db:
+            self._delete(ids)
+            self._stats = None
+
+    def _delete(self, ids):
+        for chunk_id in ids:
+            self._db.execute("DELETE FROM postings WHERE id = ?", (chunk_id,))
+            self._db.execute("DELETE FROM docs WHERE id = ?", (chunk_id,))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM docs")
+            self._stats = None
+
+    def search(self, query, k):
+        """Return up to `k` (chunk_id, score) pairs ranked by BM25."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            if self._stats is None:
+                count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+                self._stats = (count, total / count if count else 0.0)
+            count, average_length = self._stats
+            if not count:
+                return []
+            scores = Counter()
+            for term in terms:
+                rows = self._db.execute(
+                    "SELECT p.id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.id WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+    def documents(self, ids):
+        # (id, text, metadata) for the given IDs, in the same order
+        if not ids:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, text, metadata FROM docs WHERE id IN ({','.join('?' * len(ids))})", list(ids)
+            ).fetchall()
+        by_id = {chunk_id: (chunk_id, text, json.loads(metadata)) for chunk_id, text, metadata in rows}
+        return [by_id[chunk_id] for chunk_id in ids if chunk_id in by_id]
+
+    def sync_from(self, vectorstore, page_size=1000):
+        """Rebuild the index from the vector store when the two have drifted apart.
+
+        Covers knowledge bases built before the keyword index existed. Returns the
+        number of chunks indexed (0 when the counts already match).
+        """
+        collection = getattr(vectorstore, "_collection", None) # None for a QuantizedVectorStore
+        total = collection.count() if collection is not None else vectorstore.count()
+        if total == len(self):
+            return 0
+        self.clear()
+        for offset in range(0, total, page_size):
+            if collection is not None:
+                page = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+                self.add(page["ids"], page["documents"], page["metadatas"])
+            else:
+                self.add(*vectorstore.get_page(offset, page_size))
+        return total
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import threading
+
+# --- Ingestion manifest: content hashes of every file and chunk in the knowledge base ---
+# Lets re-uploads skip unchanged files and re-embed only the chunks that changed.
+# Chunk IDs are derived from the file name and chunk text, so a re-ingested chunk
+# overwrites its previous copy in Chroma instead of being stored twice.
+
+MANIFEST_VERSION = 1
+
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_id_sequence(file_name):
+    # Deterministic IDs, one call per chunk in file order, so streamed chunks can be
+    # numbered as they arrive; a counter keeps repeated identical chunks apart
+    file_key = content_hash(file_name)[:12]
+    seen = {}
+
+    def next_id(text):
+        text_key = content_hash(text)[:24]
+        occurrence = seen.get(text_key, 0)
+        seen[text_key] = occurrence + 1
+        return f"{file_key}-{text_key}-{occurrence}"
+
+    return next_id
+
+
+class IngestionManifest:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self._files = data.get("files", {})
+        except (OSError, ValueError):
+            self._files = {} # A corrupt manifest only costs a full re-ingest
+
+    def save(self):
+        with self._lock:
+            data = {"version": MANIFEST_VERSION, "files": self._files}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path) # Atomic, so a crash never leaves a half-written manifest
+
+    def get(self, file_name):
+        with self._lock:
+            return self._files.get(file_name)
+
+    def find_by_hash(self, file_hash):
+        # Name under which identical content is already stored, if any
+        with self._lock:
+            for name, entry in self._files.items():
+                if entry["sha256"] == file_hash:
+                    return name
+        return None
+
+    def record(self, file_name, file_hash, chunk_ids):
+        with self._lock:
+            self._files[file_name] = {"sha256": file_hash, "chunk_ids": list(chunk_ids)}
+
+    def clear(self):
+        with self._lock:
+            self._files = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._files)
@@ -0,0 +1,78 @@
+from retrieval import estimate_tokens
+
+# --- Conversation memory: token-bounded sliding window plus a rolling summary ---
+# The window keeps the most recent turns verbatim; anything older is folded into a
+# summary that is maintained incrementally, so the prompt size stays flat over long sessions.
+
+DEFAULT_WINDOW_TOKENS = 2048
+DEFAULT_SUMMARY_TOKENS = 512
+DEFAULT_MIN_RECENT_MESSAGES = 2
+
+
+def _message_tokens(message):
+    # Small constant for the role/turn markers the chat template adds
+    return estimate_tokens(message["content"]) + 4
+
+
+class ConversationMemory:
+    def __init__(self, window_tokens=DEFAULT_WINDOW_TOKENS, summary_tokens=DEFAULT_SUMMARY_TOKENS,
+                 min_recent_messages=DEFAULT_MIN_RECENT_MESSAGES):
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.min_recent_messages = min_recent_messages
+        self.summary = ""
+        self.summarized_count = 0 # Number of leading messages already folded into the summary
+
+    def reset(self):
+        self.summary = ""
+        self.summarized_count = 0
+
+    def _window_start(self, messages, token_limit):
+        # Walk backwards from the newest message until the token limit is reached
+        start = len(messages)
+        used = 0
+        while start > self.summarized_count:
+            cost = _message_tokens(messages[start - 1])
+            kept = len(messages) - start
+            if used + cost > token_limit and kept >= self.min_recent_messages:
+                break
+            used += cost
+            start -= 1
+        return start
+
+    def build_history(self, messages):
+        # Messages that are not summarized yet and fit the window; older overflow is dropped
+        if self.summarized_count > len(messages): # History was cleared or replaced underneath us
+            self.reset()
+        return messages[self._window_start(messages, self.window_tokens):]
+
+    def needs_compaction(self, messages):
+        # True once the messages not summarized yet overflow the window
+        start = self.summarized_count if self.summarized_count <= len(messages) else 0
+        return sum(_message_tokens(m) for m in messages[start:]) > self.window_tokens
+
+    def compact(self, messages, summarize_fn):
+        """Fold messages that fell out of the window into the summary.
+
+        Compaction shrinks the unsummarized tail to half the window, so the summarizer
+        runs once every few turns rather than on every turn. The summarizer is a blocking
+        model call: run this after a response has been shown, or on a copy of the memory
+        in a background thread, so it never delays time-to-first-token.
+        """
+        if self.summarized_count > len(messages):
+            self.reset()
+        if not self.needs_compaction(messages):
+            return False
+
+        fold_end = self._window_start(messages, self.window_tokens // 2)
+        to_fold = messages[self.summarized_count:fold_end]
+        if not to_fold:
+            return False
+
+        new_summary = summarize_fn(self.summary, to_fold, self.summary_tokens)
+        if not new_summary or not new_summary.strip():
+            return False # Keep the old state; the window still bounds the prompt
+        # Hard cap in case the model ignores the requested length
+        self.summary = new_summary.strip()[:self.summary_tokens * 4]
+        self.summarized_count = fold_end
+        return True
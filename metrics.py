@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# --- Latency and throughput metrics ---
+# Every event is appended as one JSON line to a size-rotated local log and kept in a
+# bounded in-memory window, from which the diagnostics panel computes rolling percentiles.
+
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+DEFAULT_WINDOW = 500 # Events kept in memory per kind
+
+
+def percentile(values, q):
+    # Linear interpolation between closest ranks, like numpy's default
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "min": min(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values)
+    }
+
+
+def ollama_timings(response):
+    # Convert the nanosecond counters Ollama sends with its final chunk into milliseconds
+    stats = {}
+    for source, target in (("load_duration", "load_ms"), ("prompt_eval_duration", "prompt_eval_ms"),
+                           ("eval_duration", "eval_ms"), ("total_duration", "server_total_ms")):
+        value = response.get(source)
+        if value is not None:
+            stats[target] = value / 1e6
+    for key in ("prompt_eval_count", "eval_count"):
+        if response.get(key) is not None:
+            stats[key] = response.get(key)
+    if stats.get("eval_count") and stats.get("eval_ms"):
+        stats["tokens_per_sec"] = stats["eval_count"] / (stats["eval_ms"] / 1000)
+    return stats
+
+
+class MetricsRecorder:
+    def __init__(self, log_path=None, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT,
+                 window=DEFAULT_WINDOW):
+        self._lock = threading.Lock()
+        self._events = defaultdict(lambda: deque(maxlen=window))
+        self._logger = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            # A dedicated logger, so metrics never mix with (or propagate to) application logs
+            self._logger = logging.getLogger(f"assistant.metrics.{os.path.abspath(log_path)}")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            if not self._logger.handlers:
+                handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count,
+                                              encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._logger.addHandler(handler)
+
+    def record(self, kind, **fields):
+        event = {"ts": time.time(), "kind": kind, **fields}
+        with self._lock:
+            self._events[kind].append(event)
+        if self._logger is not None:
+            self._logger.info(json.dumps(event, ensure_ascii=False, default=str))
+        return event
+
+    @contextmanager
+    def span(self, kind, **fields):
+        # Wall-clock timing of a block; extra fields can be added to the yielded dict
+        started = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(kind, duration_ms=(time.perf_counter() - started) * 1000, **fields)
+
+    def values(self, kind, field):
+        with self._lock:
+            return [e[field] for e in self._events.get(kind, ()) if isinstance(e.get(field), (int, float))]
+
+    def rolling_summary(self, kind, field):
+        return summarize(self.values(kind, field))
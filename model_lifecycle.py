@@ -0,0 +1,120 @@
+import threading
+import time
+
+import ollama
+
+from scheduler import PRIORITY_BACKGROUND
+
+# --- Model warm-up and keep-alive ---
+# Loads the chat and embedding models in the background as soon as they are selected,
+# so the first real question or upload does not pay the model load time. Every request
+# passes the same keep_alive, which keeps Ollama from unloading a model between turns.
+# With a scheduler, a warm-up waits for a model slot like any other background request.
+
+DEFAULT_KEEP_ALIVE_SECONDS = 30 * 60
+DEFAULT_PS_TTL_SECONDS = 5 # How long the daemon's list of loaded models is trusted
+RETRY_AFTER_FAILURE_SECONDS = 30
+
+STATUS_COLD = "cold"
+STATUS_LOADING = "loading"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+KIND_CHAT = "chat"
+KIND_EMBEDDING = "embedding"
+
+
+def _base_name(model):
+    return model if ":" in model else f"{model}:latest"
+
+
+class ModelLifecycleManager:
+    def __init__(self, keep_alive=DEFAULT_KEEP_ALIVE_SECONDS, client=None, ps_ttl_seconds=DEFAULT_PS_TTL_SECONDS,
+                 scheduler=None):
+        self.keep_alive = keep_alive
+        self.ps_ttl_seconds = ps_ttl_seconds
+        self.scheduler = scheduler # scheduler.RequestScheduler
+        self._client = client or ollama
+        self._lock = threading.Lock()
+        self._states = {} # model -> {"status", "error", "load_seconds", "kind"}
+        self._loaded = set()
+        self._loaded_checked_at = 0.0
+        self._ps_running = False
+
+    def _loaded_models(self):
+        # The last known resident models. Once that list is older than the TTL it is refreshed
+        # in the background, so callers (every rerun) never wait on the daemon
+        with self._lock:
+            if time.time() - self._loaded_checked_at >= self.ps_ttl_seconds and not self._ps_running:
+                self._ps_running = True
+                threading.Thread(target=self._refresh_loaded, daemon=True).start()
+            return set(self._loaded)
+
+    def _refresh_loaded(self):
+        started = time.time()
+        try:
+            loaded = {_base_name(m["model"]) for m in self._client.ps()["models"]}
+        except Exception:
+            loaded = None
+        with self._lock:
+            if loaded is not None:
+                # A model that finished warming while ps() was in flight is resident too
+                self._loaded = loaded | {model for model, state in self._states.items()
+                                         if state.get("ready_at", 0) >= started}
+            self._loaded_checked_at = time.time()
+            self._ps_running = False
+
+    def status(self, model):
+        # (status, detail) where detail is the load time in seconds or the error message
+        model = _base_name(model)
+        loaded = self._loaded_models()
+        with self._lock:
+            state = self._states.get(model)
+            if state and state["status"] in (STATUS_LOADING, STATUS_FAILED):
+                return state["status"], state.get("error")
+            if model in loaded:
+                return STATUS_READY, state.get("load_seconds") if state else None
+            return STATUS_COLD, None
+
+    def is_loading(self):
+        with self._lock:
+            return any(state["status"] == STATUS_LOADING for state in self._states.values())
+
+    def ensure_warm(self, model, kind=KIND_CHAT):
+        """Start loading `model` in the background unless it is resident or already loading."""
+        status, _ = self.status(model)
+        if status in (STATUS_READY, STATUS_LOADING):
+            return status
+        model = _base_name(model)
+        with self._lock:
+            state = self._states.get(model)
+            if state and state["status"] == STATUS_LOADING:
+                return STATUS_LOADING
+            if state and state["status"] == STATUS_FAILED and time.time() - state["failed_at"] < RETRY_AFTER_FAILURE_SECONDS:
+                return STATUS_FAILED
+            self._states[model] = {"status": STATUS_LOADING, "kind": kind}
+        threading.Thread(target=self._warm, args=(model, kind), daemon=True).start()
+        return STATUS_LOADING
+
+    def _warm(self, model, kind):
+        started = time.perf_counter()
+        try:
+            if self.scheduler is not None:
+                self.scheduler.acquire(model, "model-warm-up", PRIORITY_BACKGROUND)
+            try:
+                if kind == KIND_EMBEDDING:
+                    self._client.embed(model=model, input="warm-up", keep_alive=self.keep_alive)
+                else:
+                    # An empty prompt only loads the model into memory
+                    self._client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+            finally:
+                if self.scheduler is not None:
+                    self.scheduler.release(model)
+            state = {"status": STATUS_READY, "kind": kind, "load_seconds": time.perf_counter() - started,
+                     "ready_at": time.time()}
+        except Exception as e:
+            state = {"status": STATUS_FAILED, "kind": kind, "error": str(e), "failed_at": time.time()}
+        with self._lock:
+            self._states[model] = state
+            if state["status"] == STATUS_READY:
+                self._loaded.add(model)
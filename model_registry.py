@@ -0,0 +1,59 @@
+import threading
+import time
+from dataclasses import dataclass, field
+
+import ollama
+
+# --- Model registry: one cached snapshot of the Ollama model inventory ---
+# Every Streamlit rerun needs the model list (health check, model picker, validation);
+# caching it avoids an HTTP round-trip to the daemon on each widget interaction.
+
+DEFAULT_TTL_SECONDS = 60
+DEFAULT_FAILURE_TTL_SECONDS = 3 # Retry soon after a failure so a freshly started daemon is picked up
+
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    running: bool
+    models: tuple = field(default_factory=tuple)
+    fetched_at: float = 0.0
+    error: str = ""
+
+    def has_model(self, name):
+        # Accept both "gemma3n" and "gemma3n:latest" style names
+        if name in self.models:
+            return True
+        return ":" not in name and f"{name}:latest" in self.models
+
+
+class ModelRegistry:
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, failure_ttl_seconds=DEFAULT_FAILURE_TTL_SECONDS,
+                 list_fn=None):
+        self.ttl_seconds = ttl_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self._list_fn = list_fn or ollama.list
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _fetch(self):
+        try:
+            models = tuple(m["model"] for m in self._list_fn()["models"])
+            return ModelSnapshot(running=True, models=models, fetched_at=time.time())
+        except Exception as e:
+            return ModelSnapshot(running=False, fetched_at=time.time(), error=str(e))
+
+    def _is_fresh(self, snapshot):
+        ttl = self.ttl_seconds if snapshot.running else self.failure_ttl_seconds
+        return time.time() - snapshot.fetched_at < ttl
+
+    def snapshot(self):
+        # Shared across sessions: only one caller refreshes an expired snapshot
+        with self._lock:
+            if self._snapshot is None or not self._is_fresh(self._snapshot):
+                self._snapshot = self._fetch()
+            return self._snapshot
+
+    def refresh(self):
+        with self._lock:
+            self._snapshot = self._fetch()
+            return self._snapshot
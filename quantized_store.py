@@ -0,0 +1,357 @@
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# --- Compact knowledge base vectors: inverted lists of int8 codes with exact re-ranking ---
+# An alternative to Chroma for large knowledge bases on CPU-only machines. Each chunk's
+# vector is normalized and kept in memory-mapped files twice: as int8 codes with one float32
+# scale per row, which searches scan, and as the exact float32 vector, which is only read for
+# the best few candidates to re-rank them. Once the store holds _LIST_MIN_ROWS chunks, the
+# vectors are clustered around 4 * sqrt(N) centroids (an IVF index) and a search only scans
+# the codes of the lists whose centroids are closest to the query, so its cost grows with
+# sqrt(N) rather than N. Smaller stores are scanned whole. Chunk text and metadata live in
+# a small SQLite file. Scores are cosine similarities, so the ranking matches Chroma's L2
+# distance on the normalized nomic-embed-text vectors.
+
+DEFAULT_RERANK_FACTOR = 8 # Candidates re-ranked per requested result
+DEFAULT_PROBE_LISTS = 48 # Closest lists scanned per search
+_INITIAL_ROWS = 64 # Small stores stay small; files grow by a quarter at a time
+_LIST_MIN_ROWS = 2048 # Below this a full scan is as fast as probing lists
+_LISTS_PER_SQRT_ROWS = 4 # 4 * sqrt(N) lists: short lists, so a probe reads few rows it does not need
+_RETRAIN_GROWTH = 2 # Lists are clustered again once the store has doubled
+_TRAIN_ROWS_PER_LIST = 32 # Sample size for clustering, per list
+_TRAIN_ITERATIONS = 10
+_SCAN_BLOCK_ROWS = 4096 # Rows converted to float32 per step, so no step needs the whole matrix in RAM
+_SQL_BATCH = 500 # Stay under SQLite's bound-parameter limit
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def quantize(vectors):
+    # Symmetric per-row int8 codes: row ≈ codes * scale
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def cluster(vectors, count, iterations=_TRAIN_ITERATIONS, seed=0):
+    # Spherical k-means: `count` unit-length centroids of the normalized `vectors`
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), count, replace=False)]
+    for _ in range(iterations):
+        nearest = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(nearest, kind="stable")
+        sizes = np.bincount(nearest, minlength=count)
+        # An empty list restarts from a random vector rather than staying unused
+        sums = vectors[rng.choice(len(vectors), count, replace=False)]
+        used = np.flatnonzero(sizes)
+        sums[used] = np.add.reduceat(vectors[order], np.concatenate([[0], np.cumsum(sizes)[:-1]])[used])
+        centroids = _normalize(sums)
+    return centroids
+
+
+class QuantizedIndex:
+    """Process-wide on-disk index shared by every QuantizedVectorStore opened on `directory`."""
+
+    def __init__(self, directory, rerank_factor=DEFAULT_RERANK_FACTOR, probe_lists=DEFAULT_PROBE_LISTS):
+        self.directory = directory
+        self.rerank_factor = rerank_factor
+        self.probe_lists = probe_lists
+        self._lock = threading.RLock()
+        self._connection = None
+        self._codes = self._scales = self._vectors = self._lists = None
+        self._live = None # True for rows that hold a stored chunk
+        self._centroids = None # One row per list once the store is clustered
+        self._members = None # (rows sorted by list, start of each list), rebuilt after changes
+        self.dim = None
+        self._rows = 0
+        self._trained_rows = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def _db(self):
+        # Opened lazily, and again after clear() has removed the files
+        if self._connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._connection = sqlite3.connect(self._path("chunks.sqlite3"), check_same_thread=False)
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL,
+                                                   document TEXT, metadata TEXT);
+                CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+            """)
+            meta = dict(self._connection.execute("SELECT name, value FROM meta"))
+            self.dim = meta.get("dim")
+            self._rows = meta.get("rows", 0)
+            self._trained_rows = meta.get("trained_rows", 0)
+            self._live = np.zeros(self._rows, dtype=bool)
+            if self.dim and self._rows:
+                self._open_matrices()
+                rows = [row for (row,) in self._connection.execute("SELECT row FROM chunks")]
+                self._live[rows] = True
+            if self.dim and meta.get("lists"):
+                self._centroids = np.fromfile(self._path("centroids.f32"), dtype=np.float32).reshape(-1, self.dim)
+        return self._connection
+
+    def _open_matrices(self):
+        shape = (self._rows, self.dim)
+        self._codes = np.memmap(self._path("codes.i8"), dtype=np.int8, mode="r+", shape=shape)
+        self._scales = np.memmap(self._path("scales.f32"), dtype=np.float32, mode="r+", shape=(self._rows,))
+        self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=shape)
+        self._lists = np.memmap(self._path("lists.i32"), dtype=np.int32, mode="r+", shape=(self._rows,))
+
+    def _close_matrices(self):
+        for matrix in (self._codes, self._scales, self._vectors, self._lists):
+            if matrix is not None:
+                matrix.flush()
+        self._codes = self._scales = self._vectors = self._lists = None
+
+    def _grow(self, needed_rows):
+        # Grow in steps of a quarter: few resizes, and little unused space in a store meant to be small
+        new_rows = max(_INITIAL_ROWS, self._rows + self._rows // 4, needed_rows)
+        self._close_matrices()
+        for name, row_bytes in (("codes.i8", self.dim), ("scales.f32", 4), ("vectors.f32", 4 * self.dim),
+                                ("lists.i32", 4)):
+            with open(self._path(name), "ab") as f:
+                f.truncate(new_rows * row_bytes)
+        self._live = np.concatenate([self._live, np.zeros(new_rows - self._rows, dtype=bool)])
+        self._rows = new_rows
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('rows', ?)", (new_rows,))
+        self._open_matrices()
+
+    def _nearest_lists(self, vectors):
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _train_lists(self):
+        # Cluster a sample of the stored vectors and file every row under its nearest centroid
+        live_rows = np.flatnonzero(self._live)
+        count = int(_LISTS_PER_SQRT_ROWS * np.sqrt(len(live_rows)))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live_rows, min(len(live_rows), count * _TRAIN_ROWS_PER_LIST), replace=False))
+        self._centroids = cluster(np.asarray(self._vectors[sample]), count)
+        for start in range(0, self._rows, _SCAN_BLOCK_ROWS):
+            stop = min(start + _SCAN_BLOCK_ROWS, self._rows)
+            self._lists[start:stop] = self._nearest_lists(np.asarray(self._vectors[start:stop]))
+        self._lists.flush()
+        self._centroids.tofile(self._path("centroids.f32"))
+        self._trained_rows = len(live_rows)
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                                 [("lists", count), ("trained_rows", self._trained_rows)])
+
+    def _rows_for(self, ids):
+        found = {}
+        for i in range(0, len(ids), _SQL_BATCH):
+            part = ids[i:i + _SQL_BATCH]
+            found.update(self._db.execute(
+                f"SELECT id, row FROM chunks WHERE id IN ({','.join('?' * len(part))})", part))
+        return found
+
+    def upsert(self, ids, vectors, texts, metadatas=None):
+        # Re-adding an ID overwrites its row, matching Chroma's upsert
+        if not ids:
+            return
+        metadatas = metadatas or [None] * len(ids)
+        latest = {chunk_id: i for i, chunk_id in enumerate(ids)} # The last copy of a repeated ID wins
+        order = sorted(latest.values())
+        ids = [ids[i] for i in order]
+        vectors = _normalize([vectors[i] for i in order])
+        with self._lock:
+            db = self._db
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (self.dim,))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"embedding dimension {vectors.shape[1]} does not match the store's {self.dim}")
+
+            existing = self._rows_for(ids)
+            new_count = len(ids) - len(existing)
+            free_rows = np.flatnonzero(~self._live)[:new_count].tolist()
+            if len(free_rows) < new_count:
+                start = self._rows
+                self._grow(self._rows + new_count - len(free_rows))
+                free_rows.extend(range(start, start + new_count - len(free_rows)))
+            free = iter(free_rows)
+            rows = np.array([existing[chunk_id] if chunk_id in existing else next(free) for chunk_id in ids])
+
+            # Vectors are on disk before SQLite points at them, so a crash never exposes a half-written row
+            codes, scales = quantize(vectors)
+            self._codes[rows] = codes
+            self._scales[rows] = scales
+            self._vectors[rows] = vectors
+            if self._centroids is not None:
+                self._lists[rows] = self._nearest_lists(vectors)
+            for matrix in (self._codes, self._scales, self._vectors, self._lists):
+                matrix.flush()
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [(int(row), chunk_id, texts[i], json.dumps(metadatas[i] or {}, ensure_ascii=False))
+                     for row, chunk_id, i in zip(rows, ids, order)]
+                )
+            self._live[rows] = True
+            self._members = None
+            live_count = int(self._live.sum())
+            if live_count >= _LIST_MIN_ROWS and live_count >= _RETRAIN_GROWTH * self._trained_rows:
+                self._train_lists()
+
+    def delete(self, ids):
+        with self._lock:
+            rows = list(self._rows_for(list(ids)).values())
+            with self._db:
+                self._db.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._live[rows] = False # Freed rows are reused by later upserts
+            self._members = None
+
+    def clear(self):
+        with self._lock:
+            self._close_matrices()
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            for name in ("chunks.sqlite3", "codes.i8", "scales.f32", "vectors.f32", "lists.i32", "centroids.f32"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            self.dim = None
+            self._rows = 0
+            self._trained_rows = 0
+            self._centroids = self._members = None
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def existing_ids(self, ids):
+        with self._lock:
+            return set(self._rows_for(list(ids)))
+
+    def get_page(self, offset, limit):
+        # (ids, texts, metadatas) of stored chunks in row order, for rebuilding the keyword index
+        with self._lock:
+            rows = self._db.execute("SELECT id, document, metadata FROM chunks ORDER BY row LIMIT ? OFFSET ?",
+                                    (limit, offset)).fetchall()
+        return [r[0] for r in rows], [r[1] for r in rows], [json.loads(r[2]) for r in rows]
+
+    def _candidate_rows(self, query, needed):
+        # Live rows of the lists closest to the query, at least `needed` of them; every live row before clustering
+        if self._centroids is None:
+            return np.flatnonzero(self._live)
+        if self._members is None:
+            live_rows = np.flatnonzero(self._live)
+            lists = self._lists[live_rows]
+            order = np.argsort(lists, kind="stable")
+            self._members = (live_rows[order], np.searchsorted(lists[order], np.arange(len(self._centroids) + 1)))
+        members, starts = self._members
+        sizes = np.diff(starts)
+        closest = np.argsort(-(self._centroids @ query))
+        # Probe more lists than asked for when the closest ones hold too few rows
+        probed = max(self.probe_lists, int(np.searchsorted(np.cumsum(sizes[closest]), needed)) + 1)
+        rows = np.concatenate([members[starts[i]:starts[i + 1]] for i in closest[:probed]])
+        rows.sort() # Sequential reads from the memory maps
+        return rows
+
+    def search(self, vector, k):
+        """Return up to `k` (chunk_id, text, metadata, cosine similarity) tuples, best first."""
+        with self._lock:
+            self._db # Loads the row map on first use
+            if k <= 0 or not self._live.any():
+                return []
+            query = _normalize(vector)
+            if query.shape[0] != self.dim:
+                raise ValueError(f"query dimension {query.shape[0]} does not match the store's {self.dim}")
+
+            # Approximate scores from the int8 codes of the candidate rows, a block at a time
+            candidates = self._candidate_rows(query, k * self.rerank_factor)
+            scores = np.empty(len(candidates), dtype=np.float32)
+            for start in range(0, len(candidates), _SCAN_BLOCK_ROWS):
+                block = candidates[start:start + _SCAN_BLOCK_ROWS]
+                scores[start:start + len(block)] = self._codes[block].astype(np.float32) @ query
+            scores *= self._scales[candidates]
+
+            # Re-rank the best of them with their exact vectors
+            shortlist = min(k * self.rerank_factor, len(candidates))
+            rows = candidates[np.sort(np.argpartition(-scores, shortlist - 1)[:shortlist])]
+            exact = self._vectors[rows] @ query
+            best = np.argsort(-exact)[:k]
+            rows, similarities = rows[best], exact[best]
+
+            by_row = {}
+            row_list = [int(row) for row in rows]
+            for i in range(0, len(row_list), _SQL_BATCH):
+                part = row_list[i:i + _SQL_BATCH]
+                for row, chunk_id, text, metadata in self._db.execute(
+                        f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(part))})",
+                        part):
+                    by_row[row] = (chunk_id, text, json.loads(metadata))
+        return [by_row[row] + (float(similarity),) for row, similarity in zip(row_list, similarities)
+                if row in by_row]
+
+
+class QuantizedVectorStore(VectorStore):
+    """LangChain vector store over a QuantizedIndex, usable wherever the app uses Chroma."""
+
+    def __init__(self, index, embedding_function):
+        self.index = index
+        self._embedding_function = embedding_function
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        ids = list(ids) if ids is not None else [os.urandom(16).hex() for _ in texts]
+        self.index.upsert(ids, self._embedding_function.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def upsert_vectors(self, ids, texts, metadatas, vectors):
+        # Precomputed vectors from the ingestion pipeline
+        self.index.upsert(ids, vectors, texts, metadatas)
+
+    def stored_ids(self, ids):
+        return self.index.existing_ids(ids)
+
+    def count(self):
+        return self.index.count()
+
+    def get_page(self, offset, limit):
+        return self.index.get_page(offset, limit)
+
+    def delete(self, ids=None, **kwargs):
+        if ids:
+            self.index.delete(ids)
+
+    def delete_collection(self):
+        self.index.clear()
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        # Scores are cosine similarities (higher is closer), unlike Chroma's distances
+        return [(Document(page_content=text, metadata=metadata, id=chunk_id), score)
+                for chunk_id, text, metadata, score in self.index.search(self._embedding_function.embed_query(query), k)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [Document(page_content=text, metadata=metadata, id=chunk_id)
+                for chunk_id, text, metadata, _ in self.index.search(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self._embedding_function.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory=None, **kwargs):
+        store = cls(QuantizedIndex(directory), embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
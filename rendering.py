@@ -0,0 +1,60 @@
+import time
+
+# --- Throttled rendering of streamed tokens ---
+# Re-rendering the whole Markdown answer for every token is quadratic in answer length
+# and floods the websocket. Pieces are buffered in a list and only joined and pushed to
+# the placeholder on a time or size cadence; the time cadence also stretches as the
+# answer grows, so a long answer needs a bounded number of (increasingly large) updates.
+
+DEFAULT_INTERVAL_SECONDS = 0.05
+DEFAULT_MAX_PENDING = 20
+DEFAULT_GROWTH_CHARS = 2000 # Interval grows by one base interval per this many rendered characters
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    def __init__(self, placeholder, interval=DEFAULT_INTERVAL_SECONDS, max_pending=DEFAULT_MAX_PENDING,
+                 growth_chars=DEFAULT_GROWTH_CHARS, clock=time.monotonic):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_pending = max_pending
+        self.growth_chars = growth_chars
+        self._clock = clock
+        self._parts = []
+        self._pending = 0
+        self._length = 0
+        self._last_flush = clock()
+        self.updates = 0
+
+    @property
+    def text(self):
+        # Collapse the buffer so repeated joins never re-copy more than once
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def _current_interval(self):
+        if not self.growth_chars:
+            return self.interval
+        return self.interval * (1 + self._length // self.growth_chars)
+
+    def add(self, piece):
+        if not piece:
+            return
+        self._parts.append(piece)
+        self._length += len(piece)
+        self._pending += 1
+        now = self._clock()
+        if self._pending >= self.max_pending or now - self._last_flush >= self._current_interval():
+            self._flush(now, cursor=True)
+
+    def _flush(self, now, cursor):
+        self.placeholder.markdown(self.text + (CURSOR if cursor else ""))
+        self._pending = 0
+        self._last_flush = now
+        self.updates += 1
+
+    def finish(self):
+        # Final render without the cursor; returns the full response text
+        self._flush(self._clock(), cursor=False)
+        return self.text
@@ -0,0 +1,135 @@
+import hashlib
+import re
+from collections import defaultdict
+
+from langchain_core.documents import Document
+
+# --- Retrieval helpers for the RAG chat path ---
+# Kept free of Streamlit so the same code can be reused outside the UI.
+
+# Default retrieval settings (overridable by the caller)
+DEFAULT_TOP_K = 4
+DEFAULT_CONTEXT_TOKEN_BUDGET = 1500
+
+# Retrieval modes: embeddings only, embeddings fused with BM25, or BM25 only (no embedding call)
+RETRIEVAL_VECTOR = "vector"
+RETRIEVAL_HYBRID = "hybrid"
+RETRIEVAL_KEYWORD = "keyword"
+DEFAULT_RETRIEVAL_MODE = RETRIEVAL_HYBRID
+DEFAULT_RRF_K = 60 # Damps the weight of top ranks so neither ranking dominates the fusion
+
+# CJK characters are roughly one token each; other text averages ~4 characters per token
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+
+
+def estimate_tokens(text):
+    # Cheap, tokenizer-free estimate that errs on the high side
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def _content_key(text):
+    # Normalise whitespace/case so overlapping or re-uploaded chunks collapse to one key
+    normalized = " ".join(text.split()).lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def pack_context(documents, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET):
+    """Deduplicate retrieved documents and keep as many as fit in the token budget.
+
+    Documents are expected in relevance order; a chunk that does not fit is skipped
+    so a smaller, less relevant one can still use the remaining budget.
+    """
+    packed = []
+    seen = set()
+    used_tokens = 0
+    for doc in documents:
+        content = doc.page_content.strip()
+        if not content:
+            continue
+        key = _content_key(content)
+        if key in seen:
+            continue
+        seen.add(key)
+        cost = estimate_tokens(content)
+        if used_tokens + cost > token_budget:
+            continue
+        packed.append(doc)
+        used_tokens += cost
+    return packed
+
+
+def reciprocal_rank_fusion(rankings, k=DEFAULT_RRF_K):
+    # Each ranking is a list of keys, best first; keys found by several rankings rise to the top
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def keyword_search(keyword_index, query, k):
+    hits = keyword_index.search(query, k)
+    return [Document(page_content=text, metadata=metadata, id=chunk_id)
+            for chunk_id, text, metadata in keyword_index.documents([chunk_id for chunk_id, _ in hits])]
+
+
+def _fuse(*document_lists):
+    # Chunk IDs are shared by Chroma and the keyword index; fall back to the content for documents without one
+    by_key = {}
+    rankings = []
+    for documents in document_lists:
+        ranking = []
+        for doc in documents:
+            key = doc.id or _content_key(doc.page_content)
+            by_key.setdefault(key, doc)
+            ranking.append(key)
+        rankings.append(ranking)
+    return [by_key[key] for key in reciprocal_rank_fusion(rankings)]
+
+
+def retrieve_context(vectorstore, query, top_k=DEFAULT_TOP_K, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET,
+                     keyword_index=None, mode=DEFAULT_RETRIEVAL_MODE):
+    """Return up to `top_k` chunks for `query` that fit in `token_budget`.
+
+    Without a `keyword_index` every mode falls back to plain vector search. The
+    keyword mode never calls the embedding model.
+    """
+    if not query.strip():
+        return []
+    # Over-fetch a little so deduplication does not starve the budget
+    fetch_k = top_k * 2
+    if keyword_index is not None and mode == RETRIEVAL_KEYWORD:
+        documents = keyword_search(keyword_index, query, fetch_k)
+    elif vectorstore is None:
+        return []
+    else:
+        documents = vectorstore.similarity_search(query, k=fetch_k)
+        if keyword_index is not None and mode == RETRIEVAL_HYBRID:
+            documents = _fuse(documents, keyword_search(keyword_index, query, fetch_k))
+    return pack_context(documents, token_budget)[:top_k]
+
+
+def format_context(documents):
+    blocks = []
+    for i, doc in enumerate(documents, start=1):
+        source = doc.metadata.get("source") if doc.metadata else None
+        header = f"[{i}]" + (f" ({source})" if source else "")
+        blocks.append(f"{header}\n{doc.page_content.strip()}")
+    return "\n\n".join(blocks)
+
+
+def build_chat_messages(system_instruction, history, context_documents=None, context_template="{context}",
+                        summary=None, summary_template="{summary}"):
+    # System prompt first, with the conversation summary and retrieved context appended when available
+    system_content = system_instruction
+    if summary:
+        system_content += "\n\n" + summary_template.format(summary=summary)
+    if context_documents:
+        system_content += "\n\n" + context_template.format(context=format_context(context_documents))
+    messages = [{"role": "system", "content": system_content}]
+    messages.extend({"role": m["role"], "content": m["content"]} for m in history)
+    return messages
@@ -0,0 +1,224 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+import ollama
+from langchain_core.embeddings import Embeddings
+
+# --- Process-wide scheduler for requests to Ollama ---
+# Every session (and the ingestion worker) asks for a slot before calling a model, so
+# the daemon never sees more than a fixed number of concurrent requests per model.
+# Waiting requests are served by priority first (answers before summaries before bulk
+# document embedding), then round-robin across sessions, so one busy session cannot
+# hold everyone else back. A full queue rejects new work instead of piling it up.
+
+PRIORITY_INTERACTIVE = 0 # Chat answers and query embeddings a user is waiting for
+PRIORITY_BACKGROUND = 1 # Conversation summaries
+PRIORITY_BULK = 2 # Document embedding during ingestion
+
+DEFAULT_CONCURRENCY = 1
+DEFAULT_MAX_QUEUE = 32 # Waiting requests per model before new ones are turned away
+_WAIT_POLL_SECONDS = 0.25
+
+
+class SchedulerBusyError(RuntimeError):
+    pass
+
+
+def _base_name(model):
+    return model if ":" in model else f"{model}:latest"
+
+
+class _Ticket:
+    def __init__(self, session_id, priority):
+        self.session_id = session_id
+        self.priority = priority
+        self.granted = False
+
+
+class _ModelQueue:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        # priority -> OrderedDict(session_id -> deque of tickets); the dict order is the round-robin order
+        self.waiting = {}
+
+    def waiting_count(self):
+        return sum(len(tickets) for sessions in self.waiting.values() for tickets in sessions.values())
+
+    def add(self, ticket):
+        sessions = self.waiting.setdefault(ticket.priority, OrderedDict())
+        sessions.setdefault(ticket.session_id, deque()).append(ticket)
+
+    def remove(self, ticket):
+        sessions = self.waiting.get(ticket.priority, {})
+        tickets = sessions.get(ticket.session_id)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del sessions[ticket.session_id]
+
+    def pop_next(self):
+        # Highest priority first; within a priority, the next session in turn gives up its oldest request
+        for priority in sorted(self.waiting):
+            sessions = self.waiting[priority]
+            if not sessions:
+                continue
+            session_id, tickets = next(iter(sessions.items()))
+            ticket = tickets.popleft()
+            del sessions[session_id]
+            if tickets:
+                sessions[session_id] = tickets # Back of the line for its next request
+            return ticket
+        return None
+
+    def position(self, ticket):
+        # Requests that would be served before `ticket` if nothing else arrived
+        ahead = sum(len(tickets) for priority, sessions in self.waiting.items() if priority < ticket.priority
+                    for tickets in sessions.values())
+        sessions = self.waiting.get(ticket.priority, {})
+        order = list(sessions)
+        if ticket.session_id not in sessions:
+            return ahead
+        turn = list(sessions[ticket.session_id]).index(ticket)
+        own_place = order.index(ticket.session_id)
+        for place, session_id in enumerate(order):
+            rounds = turn + 1 if place < own_place else turn
+            ahead += min(len(sessions[session_id]), rounds)
+        return ahead
+
+
+class RequestScheduler:
+    def __init__(self, default_limit=DEFAULT_CONCURRENCY, limits=None, max_queue=DEFAULT_MAX_QUEUE, recorder=None):
+        self.default_limit = default_limit
+        self.limits = {_base_name(model): limit for model, limit in (limits or {}).items()}
+        self.max_queue = max_queue
+        self.recorder = recorder
+        self._condition = threading.Condition()
+        self._queues = {}
+
+    def _queue(self, model):
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = self._queues[model] = _ModelQueue(self.limits.get(model, self.default_limit))
+        return queue
+
+    def acquire(self, model, session_id, priority=PRIORITY_INTERACTIVE, on_wait=None):
+        """Block until `model` has a free slot for this request.
+
+        `on_wait(position)` is called from the waiting thread whenever the number of
+        requests ahead changes. Raises SchedulerBusyError if the queue is full.
+        """
+        model = _base_name(model)
+        started = time.perf_counter()
+        ticket = _Ticket(session_id, priority)
+        with self._condition:
+            queue = self._queue(model)
+            if queue.active < queue.limit and not queue.waiting_count():
+                queue.active += 1
+                ticket.granted = True
+            elif queue.waiting_count() >= self.max_queue:
+                raise SchedulerBusyError(f"too many requests waiting for {model}")
+            else:
+                queue.add(ticket)
+        try:
+            reported = None
+            while True:
+                with self._condition:
+                    if ticket.granted:
+                        break
+                    position = queue.position(ticket)
+                    if position == reported:
+                        self._condition.wait(_WAIT_POLL_SECONDS)
+                        continue
+                reported = position
+                if on_wait is not None:
+                    on_wait(position + 1) # Outside the lock: the callback may be slow (e.g. a UI update)
+        except BaseException:
+            # Abandoned while waiting (for example a Streamlit rerun); give the place or slot back
+            with self._condition:
+                if ticket.granted:
+                    self._release(model)
+                else:
+                    queue.remove(ticket)
+            raise
+        if self.recorder is not None:
+            self.recorder.record("scheduler_wait", model=model, priority=priority,
+                                 wait_ms=(time.perf_counter() - started) * 1000)
+        return model
+
+    def release(self, model):
+        with self._condition:
+            self._release(_base_name(model))
+
+    def _release(self, model):
+        queue = self._queue(model)
+        queue.active -= 1
+        while queue.active < queue.limit:
+            ticket = queue.pop_next()
+            if ticket is None:
+                break
+            ticket.granted = True
+            queue.active += 1
+        self._condition.notify_all()
+
+    def load(self):
+        # {model: (active, limit, waiting)} for the diagnostics panel
+        with self._condition:
+            return {model: (queue.active, queue.limit, queue.waiting_count()) for model, queue in self._queues.items()}
+
+
+class ScheduledClient:
+    """Stands in for the ollama client in chat_engine: chat() waits for a slot first.
+
+    A streamed chat keeps its slot until the stream is exhausted or closed.
+    """
+
+    def __init__(self, scheduler, session_id, priority=PRIORITY_INTERACTIVE, on_wait=None, client=None):
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.priority = priority
+        self.on_wait = on_wait
+        self._client = client or ollama
+
+    def chat(self, model, stream=False, **kwargs):
+        self.scheduler.acquire(model, self.session_id, self.priority, self.on_wait)
+        try:
+            response = self._client.chat(model=model, stream=stream, **kwargs)
+        except BaseException:
+            self.scheduler.release(model)
+            raise
+        if not stream:
+            self.scheduler.release(model)
+            return response
+        return self._release_when_done(response, model)
+
+    def _release_when_done(self, stream, model):
+        try:
+            yield from stream
+        finally:
+            self.scheduler.release(model)
+
+
+class ScheduledEmbeddings(Embeddings):
+    # Wraps an embedder so each call waits for a slot on the embedding model
+    def __init__(self, embeddings, scheduler, model, session_id, priority=PRIORITY_INTERACTIVE):
+        self.embeddings = embeddings
+        self.scheduler = scheduler
+        self.model = model
+        self.session_id = session_id
+        self.priority = priority
+
+    def embed_documents(self, texts):
+        self.scheduler.acquire(self.model, self.session_id, self.priority)
+        try:
+            return self.embeddings.embed_documents(texts)
+        finally:
+            self.scheduler.release(self.model)
+
+    def embed_query(self, text):
+        self.scheduler.acquire(self.model, self.session_id, self.priority)
+        try:
+            return self.embeddings.embed_query(text)
+        finally:
+            self.scheduler.release(self.model)
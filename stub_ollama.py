@@ -0,0 +1,283 @@
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Stub Ollama server for benchmarks ---
+# Speaks the parts of the Ollama HTTP API the app uses (/api/tags, /api/chat,
+# /api/generate, /api/embed) with deterministic output and configurable latency:
+# a one-off model load, prefill time per prompt token and a fixed decode token rate.
+# Embeddings are hashed bag-of-words vectors, so similar texts get similar vectors
+# and retrieval behaves sensibly without a real model.
+
+DEFAULT_MODELS = ("gemma3n:latest", "nomic-embed-text:latest")
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+_VOCABULARY = (
+    "the crop soil water leaves should be checked every week and treated early when spots appear "
+    "rest fluids fever clinic doctor flood warning shelter route map school lesson practice "
+    "apply follow local guidance because conditions vary by season region and available resources"
+).split()
+
+
+def _stable_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def estimate_prompt_tokens(messages):
+    return sum(max(1, len(m.get("content", "")) // 4) for m in messages)
+
+
+class StubSettings:
+    def __init__(self, load_ms=0.0, prefill_ms_per_token=0.2, token_rate=30.0, response_tokens=64,
+                 embed_ms_per_text=2.0, embedding_dim=768, models=DEFAULT_MODELS):
+        self.load_ms = load_ms
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.token_rate = token_rate
+        self.response_tokens = response_tokens
+        self.embed_ms_per_text = embed_ms_per_text
+        self.embedding_dim = embedding_dim
+        self.models = tuple(models)
+
+
+class StubOllamaServer:
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        self.settings = settings or StubSettings()
+        self._loaded = {} # model -> unload deadline (None = stay loaded)
+        self._lock = threading.Lock()
+        self.request_counts = {}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Simulated model behaviour ---
+    def _load(self, model, keep_alive):
+        # Returns the load time in seconds paid by this request
+        now = time.monotonic()
+        with self._lock:
+            deadline = self._loaded.get(model, 0)
+            cold = model not in self._loaded or (deadline is not None and deadline < now)
+            if keep_alive in (0, "0", "0s"):
+                self._loaded.pop(model, None)
+            else:
+                seconds = _keep_alive_seconds(keep_alive)
+                self._loaded[model] = None if seconds < 0 else now + seconds
+        load_seconds = self.settings.load_ms / 1000.0 if cold else 0.0
+        if load_seconds:
+            time.sleep(load_seconds)
+        return load_seconds
+
+    def loaded_models(self):
+        now = time.monotonic()
+        with self._lock:
+            return [m for m, deadline in self._loaded.items() if deadline is None or deadline >= now]
+
+    def embed(self, text):
+        vector = [0.0] * self.settings.embedding_dim
+        for word in _WORD_PATTERN.findall(text.lower()):
+            h = _stable_hash(word)
+            vector[h % self.settings.embedding_dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def response_words(self, seed_text, count):
+        h = _stable_hash(seed_text)
+        words = []
+        for i in range(count):
+            h = (h * 6364136223846793005 + 1442695040888963407) & 0xFFFFFFFFFFFFFFFF
+            words.append(_VOCABULARY[(h >> 33) % len(_VOCABULARY)])
+        return words
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass # Keep benchmark output clean
+
+            def _count(self):
+                path = self.path.split("?")[0]
+                with server._lock:
+                    server.request_counts[path] = server.request_counts.get(path, 0) + 1
+
+            def _send_json(self, obj, status=200):
+                body = json.dumps(obj).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _start_stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+            def _write_chunk(self, obj):
+                data = (json.dumps(obj) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _end_stream(self):
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def do_HEAD(self):
+                self._count()
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                self._count()
+                if self.path.startswith("/api/tags"):
+                    self._send_json({"models": [{"model": m, "name": m, "size": 0} for m in server.settings.models]})
+                elif self.path.startswith("/api/ps"):
+                    self._send_json({"models": [{"model": m, "name": m} for m in server.loaded_models()]})
+                else:
+                    body = b"Ollama is running"
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def do_POST(self):
+                self._count()
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                model = request.get("model", "")
+                if model not in server.settings.models and f"{model}:latest" not in server.settings.models:
+                    self._send_json({"error": f"model '{model}' not found"}, status=404)
+                    return
+                if ":" not in model:
+                    model = request["model"] = f"{model}:latest"
+                if self.path == "/api/embed":
+                    self._embed(request)
+                elif self.path == "/api/embeddings":
+                    server._load(model, request.get("keep_alive"))
+                    time.sleep(server.settings.embed_ms_per_text / 1000.0)
+                    self._send_json({"embedding": server.embed(request.get("prompt", ""))})
+                elif self.path in ("/api/chat", "/api/generate"):
+                    self._generate(request)
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def _embed(self, request):
+                inputs = request.get("input", [])
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                started = time.monotonic()
+                load_seconds = server._load(request["model"], request.get("keep_alive"))
+                time.sleep(server.settings.embed_ms_per_text * len(inputs) / 1000.0)
+                self._send_json({
+                    "model": request["model"],
+                    "embeddings": [server.embed(text) for text in inputs],
+                    "load_duration": int(load_seconds * 1e9),
+                    "total_duration": int((time.monotonic() - started) * 1e9)
+                })
+
+            def _generate(self, request):
+                started = time.monotonic()
+                model = request["model"]
+                is_chat = self.path == "/api/chat"
+                messages = request.get("messages") or [{"role": "user", "content": request.get("prompt", "")}]
+                load_seconds = server._load(model, request.get("keep_alive"))
+
+                # An empty generate request is how clients preload a model
+                if not is_chat and not request.get("prompt"):
+                    self._send_json({"model": model, "response": "", "done": True, "done_reason": "load",
+                                     "load_duration": int(load_seconds * 1e9)})
+                    return
+
+                prompt_tokens = estimate_prompt_tokens(messages)
+                prefill_seconds = prompt_tokens * server.settings.prefill_ms_per_token / 1000.0
+                time.sleep(prefill_seconds)
+
+                count = server.settings.response_tokens
+                num_predict = (request.get("options") or {}).get("num_predict")
+                if num_predict and num_predict > 0:
+                    count = min(count, num_predict)
+                words = server.response_words(messages[-1].get("content", ""), count)
+                per_token = 1.0 / server.settings.token_rate if server.settings.token_rate > 0 else 0.0
+
+                def piece(text):
+                    if is_chat:
+                        return {"model": model, "message": {"role": "assistant", "content": text}, "done": False}
+                    return {"model": model, "response": text, "done": False}
+
+                def final(decode_seconds):
+                    done = {
+                        "model": model,
+                        "done": True,
+                        "done_reason": "stop",
+                        "total_duration": int((time.monotonic() - started) * 1e9),
+                        "load_duration": int(load_seconds * 1e9),
+                        "prompt_eval_count": prompt_tokens,
+                        "prompt_eval_duration": int(prefill_seconds * 1e9),
+                        "eval_count": count,
+                        "eval_duration": int(decode_seconds * 1e9)
+                    }
+                    if is_chat:
+                        done["message"] = {"role": "assistant", "content": ""}
+                    else:
+                        done["response"] = ""
+                    return done
+
+                decode_started = time.monotonic()
+                if request.get("stream", True):
+                    self._start_stream()
+                    for i, word in enumerate(words):
+                        time.sleep(per_token)
+                        self._write_chunk(piece(word if i == 0 else " " + word))
+                    self._write_chunk(final(time.monotonic() - decode_started))
+                    self._end_stream()
+                else:
+                    time.sleep(per_token * count)
+                    response = final(time.monotonic() - decode_started)
+                    text = " ".join(words)
+                    if is_chat:
+                        response["message"]["content"] = text
+                    else:
+                        response["response"] = text
+                    self._send_json(response)
+
+        return Handler
+
+
+def _keep_alive_seconds(keep_alive):
+    # Ollama accepts seconds or duration strings such as "5m"; negative means forever
+    if keep_alive is None:
+        return 300
+    if isinstance(keep_alive, (int, float)):
+        return keep_alive
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)([smh]?)", str(keep_alive).strip())
+    if not match:
+        return 300
+    value = float(match.group(1))
+    return value * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]